@@ -1,54 +1,214 @@
 from crewai import Agent, LLM
-from TravelTools import search_web_tool
+from TravelTools import search_web_tool, search_web_batch_tool
+from TravelLimits import call_with_retry, http_client
+from TravelRouting import DEFAULT_TIER, MODEL_ROUTING, MODEL_TIERS, model_router
+from TravelTrace import count_tokens, span
+import litellm
 import os
+import threading
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
+# Reuse pooled HTTP connections for every LLM request
+litellm.client_session = http_client()
+
 # Load Mistral API key from environment variables
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
 
+
+class TravelLLM(LLM):
+    """
+    LLM whose calls go through the shared rate limiter, with retries and
+    backoff on provider rate limits and transient errors
+    """
+
+    def call(self, messages, *args, **kwargs):
+        with span("llm_call", "llm", model=self.model) as info:
+            return self.send(info, messages, *args, **kwargs)
+
+    def send(self, info, messages, *args, **kwargs):
+        """
+        Make one call with retries, counting its tokens into the span args info.
+        info["provider_s"] is the time the provider took to answer, without
+        waiting for a rate limit slot or backing off between retries.
+        """
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = "\n".join(str(message.get("content") or "") for message in messages)
+        info["prompt_tokens"] = count_tokens(prompt, self.model)
+
+        def timed_complete(*args, **kwargs):
+            # Runs once the call holds its rate limit slot
+            started = time.perf_counter()
+            try:
+                return self.complete(*args, **kwargs)
+            finally:
+                info["provider_s"] = round(time.perf_counter() - started, 3)
+
+        response = call_with_retry("llm", timed_complete, messages, *args, **kwargs)
+        info["completion_tokens"] = count_tokens(str(response), self.model)
+        return response
+
+    def complete(self, *args, **kwargs):
+        """
+        Send one request to the provider (overridden by offline stand-ins)
+        """
+        return super().call(*args, **kwargs)
+
+
+def make_llm(model):
+    """
+    Create the LLM for a model
+    (TRAVEL_LLM_BASE_URL points it at another endpoint, e.g. a local mock server)
+    """
+    return TravelLLM(
+        model=model,
+        temperature=0.2,
+        base_url=os.environ.get("TRAVEL_LLM_BASE_URL"),
+    )
+
+
+class RoutedLLM(TravelLLM):
+    """
+    LLM of one pipeline stage's agent. Every call goes to the model of the
+    tier the router picks (see TravelRouting), and its span records the
+    tier, any fallback, whether it went over budget and its estimated cost.
+    Only the provider's answer time counts against the tier's latency budget.
+    A call over budget still completes on its tier; only later calls fall back.
+    """
+
+    def __new__(cls, stage, router=model_router, make_llm=make_llm):
+        # LLM.__new__ picks the class to build from the model name, so hand it the stage's model
+        return super().__new__(cls, router.tier(stage).model, is_litellm=True, temperature=0.2)
+
+    def __init__(self, stage, router=model_router, make_llm=make_llm):
+        super().__init__(model=router.tier(stage).model, temperature=0.2)
+        self.stage = stage
+        self.router = router
+        self.make_llm = make_llm
+        self._llms = {}
+        self._lock = threading.Lock()
+
+    def __copy__(self):
+        # LLM.__copy__ would return a plain LLM and drop the routing
+        return RoutedLLM(self.stage, self.router, self.make_llm)
+
+    def tier_llm(self, tier):
+        """
+        The LLM of a tier, created on first use
+        """
+        with self._lock:
+            if tier.name not in self._llms:
+                self._llms[tier.name] = self.make_llm(tier.model)
+            llm = self._llms[tier.name]
+        # crewai sets the agent's stop words on this LLM
+        llm.stop = self.stop
+        return llm
+
+    def call(self, messages, *args, **kwargs):
+        tier, fallback_from = self.router.choose(self.stage)
+        with span("llm_call", "llm", model=tier.model, stage=self.stage, tier=tier.name) as info:
+            if fallback_from:
+                info["fallback_from"] = fallback_from
+            response = self.tier_llm(tier).send(info, messages, *args, **kwargs)
+            if self.router.record(tier, info["provider_s"]):
+                info["over_budget"] = True
+            info["cost_usd"] = tier.cost(info["prompt_tokens"], info["completion_tokens"])
+            return response
+
+
 # Initialize the language model
-llm = LLM(model="mistral/mistral-small-latest", temperature=0.2)
+llm = make_llm(MODEL_TIERS[DEFAULT_TIER].model)
+
+
+def stage_llm(stage, router=model_router, make_llm=make_llm):
+    """
+    LLM for the agent of a pipeline stage: routed to the stage's model tier,
+    or the default tier's model if routing is off (TRAVEL_MODEL_ROUTING=0)
+    """
+    if not MODEL_ROUTING:
+        return make_llm(router.tiers[DEFAULT_TIER].model)
+    return RoutedLLM(stage, router, make_llm)
+
 
 # Location Expert Agent
-location_expert = Agent(
-    role="Location Expert",
-    goal="Research and provide comprehensive information about travel destinations, including visa requirements, transportation options, weather, and safety information.",
-    backstory="""You are an experienced travel consultant specializing in destination research.
-    You have extensive knowledge about visa requirements, flight options, local transportation,
-    weather patterns, and safety considerations for travelers worldwide. You always use web search
-    to get the most current and accurate information.""",
-    llm=llm,
-    tools=[search_web_tool],
-    verbose=True,
-    allow_delegation=False,
-)
+def create_location_expert(llm=llm):
+    return Agent(
+        role="Location Expert",
+        goal="Research and provide comprehensive information about travel destinations, including visa requirements, transportation options, weather, and safety information.",
+        backstory="""You are an experienced travel consultant specializing in destination research.
+        You have extensive knowledge about visa requirements, flight options, local transportation,
+        weather patterns, and safety considerations for travelers worldwide. You always use web search
+        to get the most current and accurate information.""",
+        llm=llm,
+        tools=[search_web_batch_tool, search_web_tool],
+        verbose=True,
+        allow_delegation=False,
+    )
+
 
 # Local Guide Expert Agent
-guide_expert = Agent(
-    role="Local Guide Expert",
-    goal="Provide insider knowledge about local attractions, restaurants, cultural experiences, and hidden gems based on traveler interests.",
-    backstory="""You are a knowledgeable local guide who has lived in numerous cities worldwide.
-    You specialize in creating authentic travel experiences by recommending the best local spots,
-    cultural activities, restaurants, and attractions. You stay updated on current events and
-    new openings by searching the web. You tailor recommendations to match traveler preferences.""",
-    llm=llm,
-    tools=[search_web_tool],
-    verbose=True,
-    allow_delegation=False,
-)
+def create_guide_expert(llm=llm):
+    return Agent(
+        role="Local Guide Expert",
+        goal="Provide insider knowledge about local attractions, restaurants, cultural experiences, and hidden gems based on traveler interests.",
+        backstory="""You are a knowledgeable local guide who has lived in numerous cities worldwide.
+        You specialize in creating authentic travel experiences by recommending the best local spots,
+        cultural activities, restaurants, and attractions. You stay updated on current events and
+        new openings by searching the web. You tailor recommendations to match traveler preferences.""",
+        llm=llm,
+        tools=[search_web_batch_tool, search_web_tool],
+        verbose=True,
+        allow_delegation=False,
+    )
+
 
 # Travel Planner Expert Agent
-planner_expert = Agent(
-    role="Travel Planner Expert",
-    goal="Create comprehensive day-by-day travel itineraries that include accommodations, activities, dining, and logistics, optimized for budget and preferences.",
-    backstory="""You are a professional travel planner with years of experience creating
-    detailed itineraries. You excel at organizing trips efficiently, considering travel time,
-    budget constraints, and client preferences. You synthesize information from location and
-    guide experts to create seamless travel plans. You use web search to verify current prices,
-    opening hours, and booking information.""",
-    llm=llm,
-    tools=[search_web_tool],
-    verbose=True,
-    allow_delegation=False,
-)
\ No newline at end of file
+def create_planner_expert(llm=llm):
+    return Agent(
+        role="Travel Planner Expert",
+        goal="Create comprehensive day-by-day travel itineraries that include accommodations, activities, dining, and logistics, optimized for budget and preferences.",
+        backstory="""You are a professional travel planner with years of experience creating
+        detailed itineraries. You excel at organizing trips efficiently, considering travel time,
+        budget constraints, and client preferences. You synthesize information from location and
+        guide experts to create seamless travel plans. You use web search to verify current prices,
+        opening hours, and booking information.""",
+        llm=llm,
+        tools=[search_web_batch_tool, search_web_tool],
+        verbose=True,
+        allow_delegation=False,
+    )
+
+
+def create_agents(llm=None, router=model_router, make_llm=make_llm):
+    """
+    Create a fresh set of agents, keyed by the pipeline stage they run.
+    Each concurrently running plan needs its own set. The agents share llm
+    if given, otherwise each gets its stage's routed LLM (see stage_llm).
+    """
+    llms = {stage: llm or stage_llm(stage, router, make_llm) for stage in ("location", "guide", "planner")}
+    return {
+        "location": create_location_expert(llms["location"]),
+        "guide": create_guide_expert(llms["guide"]),
+        "planner": create_planner_expert(llms["planner"]),
+    }
+
+
+_default_agents = None
+_default_agents_lock = threading.Lock()
+
+
+def default_agents():
+    """
+    Agents used by plans that aren't given their own, built on first use
+    and shared by every such plan in the process, so they must not run at
+    the same time. Concurrent plans (the app's background jobs) each get a
+    set from create_agents instead.
+    """
+    global _default_agents
+    with _default_agents_lock:
+        if _default_agents is None:
+            _default_agents = create_agents()
+        return _default_agents
@@ -0,0 +1,183 @@
+"""
+Headless batch planner.
+
+Reads trip requests from a JSONL file (one object per line with from_city,
+destination_city, date_from, date_to, interests and an optional id), plans
+them on a pool of worker processes and appends one result per line to an
+output JSONL file. Trips already planned successfully in the output file
+are skipped, so an interrupted run can simply be restarted.
+
+    python TravelBatch.py trips.jsonl -o plans.jsonl --workers 4 --rate 2
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+from TravelLimits import SharedRateLimiter, install_limiter
+
+TRIP_FIELDS = ("from_city", "destination_city", "date_from", "date_to", "interests")
+
+
+def trip_id(trip):
+    """
+    Return the trip's id, or a stable hash of its parameters if it has none
+    """
+    if trip.get("id"):
+        return str(trip["id"])
+    params = json.dumps({name: str(trip.get(name, "")).strip().lower() for name in TRIP_FIELDS}, sort_keys=True)
+    return hashlib.sha1(params.encode("utf-8")).hexdigest()[:16]
+
+
+def read_trips(path):
+    """
+    Yield (line_number, trip) for every non-empty line of a JSONL file.
+    Lines that are not valid JSON objects are yielded as (line_number, None).
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                trip = json.loads(line)
+            except ValueError:
+                trip = None
+            yield line_number, trip if isinstance(trip, dict) else None
+
+
+def completed_ids(path):
+    """
+    Return the ids of trips already planned successfully in an output file
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a truncated last line behind
+                continue
+            if isinstance(record, dict) and record.get("status") == "ok":
+                done.add(record.get("id"))
+    return done
+
+
+def _init_worker(limiter):
+    install_limiter(limiter)
+
+
+def plan_trip(trip, mode):
+    """
+    Plan a single trip inside a worker process and return its output record
+    """
+    record = {"id": trip_id(trip), "trip": trip}
+    started = time.perf_counter()
+    try:
+        if trip.get("error"):
+            # Set by run_batch for lines that could not be parsed
+            raise ValueError(trip["error"])
+        missing = [name for name in TRIP_FIELDS if not trip.get(name)]
+        if missing:
+            raise ValueError(f"Missing trip fields: {', '.join(missing)}")
+        # Imported here so the parent process never loads crewai, and inside the try
+        # so a worker that fails to import it records an error instead of aborting the batch
+        from TravelCrew import run_travel_plan
+
+        result = run_travel_plan(
+            trip["from_city"],
+            trip["destination_city"],
+            date.fromisoformat(str(trip["date_from"])),
+            date.fromisoformat(str(trip["date_to"])),
+            trip["interests"],
+            mode=mode,
+        )
+        record.update(
+            status="ok",
+            location=result.location,
+            guide=result.guide,
+            planner=result.planner,
+            cached_stages=result.cached_stages,
+            timings={timing.name: round(timing.duration, 3) for timing in result.timings},
+            routing=result.routing,
+        )
+        if result.plan is not None:
+            record["plan"] = result.plan.model_dump(mode="json")
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_batch(input_path, output_path, workers=2, rate=1.0, mode="parallel", log=print):
+    """
+    Plan every pending trip of input_path and append the results to output_path.
+    Returns a dict with the number of trips planned, failed and skipped.
+    """
+    done = completed_ids(output_path)
+    stats = {"ok": 0, "error": 0, "skipped": 0}
+
+    pending = []
+    for line_number, trip in read_trips(input_path):
+        if trip is None:
+            trip = {"id": f"line-{line_number}", "error": "invalid JSON object"}
+        if trip_id(trip) in done:
+            stats["skipped"] += 1
+        else:
+            pending.append(trip)
+    log(f"{len(pending)} trips to plan, {stats['skipped']} already done")
+
+    limiter = SharedRateLimiter(rate) if rate > 0 else None
+    with open(output_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(limiter,)
+    ) as pool:
+
+        def write(futures):
+            for future in futures:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                # Flush every record so a crash loses at most the trips in flight
+                out.flush()
+                os.fsync(out.fileno())
+                stats[record["status"]] += 1
+                log(f"[{record['status']}] {record['id']} ({record['seconds']:.1f}s)")
+
+        # Keep a bounded number of trips queued so results stream out steadily
+        in_flight = set()
+        for trip in pending:
+            if len(in_flight) >= workers * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                write(finished)
+            in_flight.add(pool.submit(plan_trip, trip, mode))
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            write(finished)
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan many trips from a JSONL file without the Streamlit UI.")
+    parser.add_argument("input", help="JSONL file with one trip request per line")
+    parser.add_argument("-o", "--output", help="JSONL file to append results to (default: <input>.plans.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="number of worker processes (default: 2)")
+    parser.add_argument("-r", "--rate", type=float, default=1.0,
+                        help="max LLM + search calls per second across all workers, 0 for no limit (default: 1)")
+    parser.add_argument("--mode", choices=("parallel", "sequential"), default="parallel",
+                        help="how to run the research agents of each trip (default: parallel)")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}.plans.jsonl"
+    stats = run_batch(args.input, output, workers=args.workers, rate=args.rate, mode=args.mode)
+    print(f"Done: {stats['ok']} planned, {stats['error']} failed, {stats['skipped']} skipped -> {output}")
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,458 @@
+"""
+Offline benchmark for the planning pipeline.
+
+Runs the full location -> guide -> planner pipeline with deterministic
+stand-ins for the LLM and for DuckDuckGo, across a matrix of trip lengths and
+concurrency levels, and compares the results with a stored baseline. Each
+model tier gets its own fake model, slower for larger tiers, so the model
+routing and its fallbacks can be compared too.
+
+    python TravelBench.py --days 3,7,14 --concurrency 1,2,4
+    python TravelBench.py --routes location=standard,guide=standard,planner=standard
+    python TravelBench.py --latency-budget 0.5   # make slow calls fall back to a faster tier
+    python TravelBench.py --save-baseline        # record a new baseline
+"""
+import os
+
+# Benchmarks measure the pipeline itself: no caches, prefetched research, rate limits or trace files.
+# Set before the Travel* modules are imported, since they read them at import time.
+for _name, _value in {
+    "TRAVEL_SEARCH_CACHE": "0",
+    "TRAVEL_PLAN_CACHE": "0",
+    "TRAVEL_KNOWLEDGE": "0",
+    "TRAVEL_TRACE": "0",
+    "TRAVEL_LLM_RATE": "0",
+    "TRAVEL_SEARCH_RATE": "0",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import date, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import TravelTools
+from TravelAgents import TravelLLM, create_agents
+from TravelChunks import PLAN_CHUNK_DAYS
+from TravelCrew import run_travel_plan
+from TravelModels import Accommodation, Activity, Booking, CostItem, DayPlan, DayPlans, PlanOverview, TravelPlan
+from TravelRouting import MODEL_ROUTES, MODEL_TIERS, ModelRouter, parse_routes
+
+BASELINE_PATH = "bench_baseline.json"
+
+# Seconds between RSS samples while a cell runs
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+@dataclass
+class FakeProfile:
+    """
+    Latency and size settings of the offline stand-ins
+    """
+    llm_latency: float = 0.05
+    llm_latency_per_word: float = 0.0005
+    llm_words: int = 300
+    llm_words_per_day: int = 120
+    search_latency: float = 0.02
+    search_results: int = 10
+    snippet_words: int = 60
+    # Latency of each model tier's fake, relative to llm_latency and llm_latency_per_word
+    tier_latency: dict = field(default_factory=lambda: {"fast": 0.5, "standard": 1.0, "large": 1.5})
+
+
+PROFILE = FakeProfile()
+
+VOCABULARY = (
+    "museum attraction restaurant trattoria metro bus ticket price budget hotel visa weather "
+    "safety market gallery palace church park tour dinner lunch breakfast cuisine dish taxi "
+    "airport flight currency exchange festival neighborhood viewpoint booking opening hours"
+).split()
+
+RESEARCH_QUERIES = {
+    "Location Expert": ["visa requirements", "flights", "local transport prices", "weather", "safety advisories",
+                        "currency and budget"],
+    "Local Guide Expert": ["top attractions", "local restaurants", "cultural events", "hidden gems",
+                           "food to try", "nightlife", "shopping areas"],
+    "Travel Planner Expert": ["hotel prices", "opening hours", "booking requirements"],
+}
+
+
+def _rng(*parts):
+    seed = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def _words(rng, count):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+class FakeDDGS:
+    """
+    Deterministic stand-in for ddgs.DDGS
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query, max_results=10):
+        time.sleep(PROFILE.search_latency)
+        rng = _rng("search", query)
+        return [
+            {
+                "title": f"{query.title()} - result {i + 1}",
+                "href": f"https://site{rng.randint(1, 6)}.example/{i}",
+                "body": f"{query}. " + _words(rng, PROFILE.snippet_words),
+            }
+            for i in range(min(max_results, PROFILE.search_results))
+        ]
+
+
+def _fake_days(rng, days, activities_per_day):
+    return [
+        DayPlan(day=number, date=day, title=_words(rng, 3).title(), transport_notes=_words(rng, 8), activities=[
+            Activity(time=f"{9 + 2 * i:02d}:00", title=_words(rng, 3).capitalize(), location=_words(rng, 2),
+                     description=_words(rng, 8), category=rng.choice(("activity", "meal", "transport")),
+                     cost=rng.randint(5, 200), booking_required=rng.random() < 0.2)
+            for i in range(activities_per_day)
+        ])
+        for number, day in days
+    ]
+
+
+def _fake_structured(model, text, rng, words):
+    """
+    JSON final answer of a structured planner task: a TravelPlan, PlanOverview
+    or DayPlans of about words words, for the days the prompt asks for
+    """
+    if model is DayPlans:
+        days = [(int(number), day) for number, day in re.findall(r"- Day (\d+): (\d{4}-\d{2}-\d{2})", text)]
+    elif model is TravelPlan:
+        start = date.fromisoformat(re.search(r"from (\d{4}-\d{2}-\d{2}) to", text).group(1))
+        count = int(re.search(r"\((\d+) days\)", text).group(1))
+        days = [(number + 1, str(start + timedelta(days=number))) for number in range(count)]
+    else:
+        days = []
+    # About 20 words per activity
+    activities_per_day = max(2, words // 20 // max(1, len(days)))
+    if model is DayPlans:
+        return DayPlans(currency="EUR", days=_fake_days(rng, days, activities_per_day)).model_dump_json()
+    overview = PlanOverview(
+        currency="EUR",
+        summary=_words(rng, 40),
+        highlights=[_words(rng, 5) for _ in range(5)],
+        accommodations=[Accommodation(name=_words(rng, 2).title(), area=_words(rng, 1),
+                                      price_per_night=rng.randint(60, 300), pros=_words(rng, 6), cons=_words(rng, 6))
+                        for _ in range(3)],
+        costs=[CostItem(category=category, amount=rng.randint(20, 600), note=_words(rng, 5))
+               for category in ("flights", "accommodation", "transport pass")],
+        bookings=[Booking(item=_words(rng, 3), link=f"https://book{i}.example", note=_words(rng, 6)) for i in range(3)],
+        packing_list=_words(rng, 8).split(),
+        emergency_info=[_words(rng, 4) for _ in range(3)],
+    )
+    if model is PlanOverview:
+        return overview.model_dump_json()
+    return TravelPlan(**overview.model_dump(), days=_fake_days(rng, days, activities_per_day)).model_dump_json()
+
+
+class FakeLLM(TravelLLM):
+    """
+    Deterministic stand-in for the provider call. It answers in the ReAct
+    format crewai expects: one batched search, then a final answer whose
+    length grows with the trip length, as JSON when the task asks for a
+    structured answer. latency_factor scales its latency.
+    """
+
+    latency_factor = 1.0
+
+    def complete(self, messages, *args, **kwargs):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        text = "\n".join(str(message.get("content") or "") for message in messages)
+        time.sleep(PROFILE.llm_latency * self.latency_factor)
+        role = next((role for role in RESEARCH_QUERIES if f"You are {role}" in text), "Travel Planner Expert")
+
+        # crewai appends the tool observation as an assistant message
+        if not any(message.get("role") == "assistant" for message in messages):
+            queries = RESEARCH_QUERIES[role]
+            return ("Thought: I should search for all topics at once.\n"
+                    "Action: search_web_batch_tool\n"
+                    f"Action Input: {json.dumps({'queries': queries})}")
+
+        rng = _rng("llm", text[:2000])
+        days = re.search(r"\((\d+) days\)", text)
+        words = PROFILE.llm_words + (PROFILE.llm_words_per_day * int(days.group(1)) if days else 0)
+        # Structured tasks put their model's JSON schema in the prompt (see TravelTasks._json_format)
+        model = next((model for model in (TravelPlan, PlanOverview, DayPlans)
+                      if f'"title": "{model.__name__}"' in text), None)
+        if model is not None:
+            answer = _fake_structured(model, text, rng, words)
+        else:
+            lines = [f"# {role} report"]
+            for section in ("Attractions", "Restaurants", "Transport", "Costs", "Weather and safety"):
+                lines.append(f"## {section}")
+                for _ in range(max(1, words // 60)):
+                    lines.append(f"- {_words(rng, 10).capitalize()} €{rng.randint(5, 200)}")
+            answer = "\n".join(lines)
+        # Generation time grows with the length of the answer
+        time.sleep(PROFILE.llm_latency_per_word * self.latency_factor * len(answer.split()))
+        return "Thought: I now know the final answer\nFinal Answer: " + answer
+
+
+def install_fakes(routes=None, latency_budget=None):
+    """
+    Route searches to FakeDDGS and return a function that creates the agents
+    of one plan, each on a fake model of its routed tier. latency_budget,
+    if given, replaces every tier's budget (seconds per call).
+    """
+    TravelTools.DDGS = FakeDDGS
+    TravelTools._ddgs_local = threading.local()
+    TravelTools.search_cache = None
+
+    tiers = {name: replace(tier, latency_budget=latency_budget) if latency_budget is not None else tier
+             for name, tier in MODEL_TIERS.items()}
+    factors = {tier.model: PROFILE.tier_latency.get(name, 1.0) for name, tier in tiers.items()}
+
+    def make_llm(model):
+        llm = FakeLLM(model=model, temperature=0.2)
+        llm.latency_factor = factors.get(model, 1.0)
+        return llm
+
+    # A router per plan, so one plan's fallbacks don't change the next plan's routing
+    return lambda: create_agents(router=ModelRouter(tiers, routes), make_llm=make_llm)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb():
+    """
+    Peak RSS of the whole process so far (0.0 where the platform can't tell)
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """
+    Current RSS of the process, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """
+    Samples the current RSS in a background thread while a cell runs, so
+    each cell reports its own peak rather than the process-lifetime peak.
+    peak is None where the current RSS can't be read.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+        return rss is not None
+
+    def _run(self):
+        while self._sample() and not self._stop.wait(self.interval):
+            pass
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def _plan_once(make_agents, days, chunk_days):
+    date_from = date(2030, 6, 1)
+    started = time.perf_counter()
+    result = run_travel_plan(
+        "New Delhi", "Rome", date_from, date_from + timedelta(days=days - 1), "sightseeing and good food",
+        cache=None, agents=make_agents(), chunk_days=chunk_days,
+    )
+    latency = time.perf_counter() - started
+    tokens = sum(row["prompt_tokens"] + row["completion_tokens"] for row in result.trace.summary())
+    cost = sum(row["cost_usd"] for row in result.routing)
+    fallbacks = sum(row["fallbacks"] for row in result.routing)
+    return latency, tokens, cost, fallbacks
+
+
+def run_cell(make_agents, days, concurrency, repeats, chunk_days=PLAN_CHUNK_DAYS):
+    """
+    Run concurrency * repeats plans of the given length, concurrency at a time
+    """
+    runs = concurrency * repeats
+    started = time.perf_counter()
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda _: _plan_once(make_agents, days, chunk_days), range(runs)))
+    wall = time.perf_counter() - started
+    latencies = [sample[0] for sample in samples]
+    return {
+        "days": days,
+        "concurrency": concurrency,
+        "runs": runs,
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "throughput_per_min": round(runs / wall * 60, 2),
+        "peak_rss_mb": round(rss.peak, 1) if rss.peak is not None else None,
+        "tokens_per_plan": round(sum(sample[1] for sample in samples) / runs),
+        "cost_per_plan": round(sum(sample[2] for sample in samples) / runs, 6),
+        "fallbacks_per_plan": round(sum(sample[3] for sample in samples) / runs, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of regressions of results against a baseline
+    """
+    previous = {(cell["days"], cell["concurrency"]): cell for cell in baseline.get("results", [])}
+    regressions = []
+    for cell in results:
+        before = previous.get((cell["days"], cell["concurrency"]))
+        if before is None:
+            continue
+        name = f"{cell['days']}d x{cell['concurrency']}"
+        for metric in ("p50_s", "p95_s", "tokens_per_plan", "cost_per_plan", "peak_rss_mb"):
+            if before.get(metric) and cell[metric] is not None and cell[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {cell[metric]}")
+        if before["throughput_per_min"] and cell["throughput_per_min"] < before["throughput_per_min"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_per_min {before['throughput_per_min']} -> "
+                               f"{cell['throughput_per_min']}")
+    return regressions
+
+
+def format_table(results):
+    columns = ("days", "concurrency", "runs", "p50_s", "p95_s", "throughput_per_min", "peak_rss_mb",
+               "tokens_per_plan", "cost_per_plan", "fallbacks_per_plan")
+    lines = [" | ".join(columns)]
+    for cell in results:
+        lines.append(" | ".join(str(cell[column]) for column in columns))
+    return "\n".join(lines)
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the planning pipeline offline with fake LLM and search.")
+    parser.add_argument("--days", type=_int_list, default=[3, 7, 14], help="trip lengths (default: 3,7,14)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4],
+                        help="plans run at the same time (default: 1,2,4)")
+    parser.add_argument("--repeats", type=int, default=2, help="rounds per cell (default: 2)")
+    parser.add_argument("--llm-latency", type=float, default=PROFILE.llm_latency, help="seconds per fake LLM call")
+    parser.add_argument("--llm-latency-per-word", type=float, default=PROFILE.llm_latency_per_word,
+                        help="extra seconds per word of a fake final answer")
+    parser.add_argument("--llm-words", type=int, default=PROFILE.llm_words, help="words per fake answer")
+    parser.add_argument("--search-latency", type=float, default=PROFILE.search_latency,
+                        help="seconds per fake search")
+    parser.add_argument("--search-results", type=int, default=PROFILE.search_results, help="results per fake search")
+    parser.add_argument("--chunk-days", type=int, default=PLAN_CHUNK_DAYS,
+                        help=f"plan trips in chunks of this many days, 0 for one call (default: {PLAN_CHUNK_DAYS})")
+    parser.add_argument("--routes", type=parse_routes, default=MODEL_ROUTES,
+                        help="model tier of each stage, e.g. location=fast,guide=fast,planner=large "
+                             "(default: TRAVEL_MODEL_ROUTES)")
+    parser.add_argument("--latency-budget", type=float, default=None,
+                        help="seconds per call before a tier falls back to a faster one (default: the tiers' own)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help=f"baseline file (default: {BASELINE_PATH})")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before a regression is reported (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    PROFILE.llm_latency = args.llm_latency
+    PROFILE.llm_latency_per_word = args.llm_latency_per_word
+    PROFILE.llm_words = args.llm_words
+    PROFILE.search_latency = args.search_latency
+    PROFILE.search_results = args.search_results
+    make_agents = install_fakes(args.routes, args.latency_budget)
+
+    results = []
+    for days in args.days:
+        for concurrency in args.concurrency:
+            results.append(run_cell(make_agents, days, concurrency, args.repeats, args.chunk_days))
+            print(format_table(results[-1:]).splitlines()[-1], flush=True)
+
+    print()
+    print(format_table(results))
+    process_peak = round(peak_rss_mb(), 1)
+    print(f"\nProcess peak RSS: {process_peak} MB")
+    report = {"profile": vars(PROFILE), "chunk_days": args.chunk_days, "routes": args.routes,
+              "latency_budget": args.latency_budget, "process_peak_rss_mb": process_peak, "results": results}
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("profile") != report["profile"]:
+        print("\nWarning: baseline was recorded with a different fake profile")
+    if baseline.get("chunk_days", args.chunk_days) != args.chunk_days:
+        print(f"\nWarning: baseline was recorded with --chunk-days {baseline['chunk_days']}")
+    if baseline.get("routes", args.routes) != args.routes or \
+            baseline.get("latency_budget", args.latency_budget) != args.latency_budget:
+        print("\nWarning: baseline was recorded with other model routes or latency budgets")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
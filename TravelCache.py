@@ -0,0 +1,412 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Default location of the on-disk caches
+CACHE_DIR = os.environ.get("TRAVEL_CACHE_DIR", ".cache")
+
+# Time-to-live per search topic (seconds). Fast-changing topics expire sooner.
+HOUR = 60 * 60
+DAY = 24 * HOUR
+TOPIC_TTLS = {
+    "visa": 1 * DAY,
+    "safety": 12 * HOUR,
+    "weather": 1 * DAY,
+    "flights": 1 * DAY,
+    "prices": 3 * DAY,
+    "transport": 7 * DAY,
+    "events": 2 * DAY,
+    "restaurants": 14 * DAY,
+    "attractions": 30 * DAY,
+    "general": 3 * DAY,
+}
+
+# Keywords used to assign a query to a topic, checked in order
+TOPIC_KEYWORDS = [
+    ("visa", ("visa", "passport", "entry requirement", "immigration", "evisa")),
+    ("safety", ("safety", "safe", "advisory", "warning", "crime", "scam", "emergency")),
+    ("weather", ("weather", "temperature", "rain", "climate", "forecast")),
+    ("flights", ("flight", "flights", "airline", "airfare")),
+    ("events", ("event", "events", "festival", "concert", "exhibition")),
+    ("prices", ("price", "prices", "cost", "budget", "exchange rate", "currency", "hotel", "hotels")),
+    ("transport", ("metro", "bus", "taxi", "train", "transport", "uber", "tram", "ticket")),
+    ("restaurants", ("restaurant", "restaurants", "food", "eat", "dish", "cafe", "bar", "nightlife")),
+    ("attractions", ("attraction", "attractions", "museum", "landmark", "things to do", "sightseeing",
+                     "hidden gem", "opening hours", "market", "shopping")),
+]
+
+# Words that do not change the meaning of a search query.
+# "from" and "to" are kept: they give a route its direction.
+STOPWORDS = {
+    "a", "an", "the", "in", "of", "for", "and", "on", "at", "is", "are", "what", "best",
+    "top", "during", "with", "near", "current", "latest", "2024", "2025", "2026",
+}
+
+
+def normalize_query(query):
+    """
+    Normalize a search query so that near-identical queries share a cache key.
+    Lowercases and strips punctuation and stopwords. Word order is kept, so
+    "flights from Rome to New Delhi" is not the return of the outbound query.
+    """
+    words = re.findall(r"[\w']+", query.lower())
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def _stem(word):
+    # Fold plurals so "hotels" and "hotel" are the same term
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+# Words that give a route its direction
+DIRECTION_WORDS = ("from", "to")
+
+
+def query_terms(query):
+    """
+    Set of normalized, plural-folded terms of a search query. The word after
+    "from" or "to" also gives a shingle such as "to:rome", so a route and its
+    reverse are told apart although they share every word.
+    """
+    terms, direction = set(), None
+    for word in normalize_query(query).split():
+        if word in DIRECTION_WORDS:
+            direction = word
+            continue
+        word = _stem(word)
+        terms.add(word)
+        if direction is not None:
+            terms.add(f"{direction}:{word}")
+            direction = None
+    return terms
+
+
+def classify_topic(query):
+    """
+    Return the topic of a search query, used to pick its TTL
+    """
+    text = query.lower()
+    for topic, keywords in TOPIC_KEYWORDS:
+        if any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in keywords):
+            return topic
+    return "general"
+
+
+class TTLCache:
+    """
+    SQLite-backed key/value cache with per-entry expiry and LRU eviction.
+    Values are stored as JSON. Safe to share between threads and processes.
+    """
+
+    def __init__(self, path, table="cache", max_entries=5000, max_bytes=50 * 1024 * 1024):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table):
+            raise ValueError(f"Invalid cache table name: {table}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table} (last_access)")
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if missing or expired
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        """
+        Store value under key for ttl seconds, then evict down to the size limits
+        """
+        now = time.time()
+        payload = json.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, last_access) "
+                f"VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now + ttl, now),
+            )
+            self._evict(now)
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self, now):
+        # Expired entries go first, then least recently used ones until within limits
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        count, total = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, the others wait for it and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+class SearchCache:
+    """
+    Persistent cache for web search results with per-topic TTLs and request
+    coalescing, so identical concurrent searches trigger one live search.
+    """
+
+    def __init__(self, path=None, max_entries=5000, max_bytes=50 * 1024 * 1024, topic_ttls=None):
+        self.store = TTLCache(
+            path or os.path.join(CACHE_DIR, "search_cache.sqlite3"),
+            table="search",
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+        )
+        self.topic_ttls = dict(TOPIC_TTLS, **(topic_ttls or {}))
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_search(self, query, search):
+        """
+        Return cached results for query, or call search(query) once and cache them
+        """
+        key = normalize_query(query) or query.strip().lower()
+        cached = self.store.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        def fetch():
+            # Another caller may have filled the cache while we waited for the lock
+            cached = self.store.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            results = search(query)
+            self.store.set(key, results, self.topic_ttls[classify_topic(query)])
+            return results
+
+        return self.flight.do(key, fetch)
+
+
+class SearchRegistry:
+    """
+    Registry of the searches made during one plan. A query whose terms
+    closely match an earlier query's (TF-IDF cosine of at least threshold,
+    with IDF over the run's own queries so the destination name weighs
+    little) gets the earlier results instead of a new live search.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = []
+        self.searches = 0
+        self.avoided = 0
+
+    def _match(self, terms):
+        documents = [entry["terms"] for entry in self._entries] + [terms]
+        idf = {}
+        for term in set().union(*documents):
+            frequency = sum(term in document for document in documents)
+            idf[term] = math.log((1 + len(documents)) / (1 + frequency)) + 1
+
+        def norm(document):
+            return math.sqrt(sum(idf[term] ** 2 for term in document))
+
+        best, best_score = None, 0.0
+        for entry in self._entries:
+            if not terms or not entry["terms"]:
+                continue
+            score = sum(idf[term] ** 2 for term in terms & entry["terms"]) / (norm(terms) * norm(entry["terms"]))
+            if score > best_score:
+                best, best_score = entry, score
+        return (best, best_score) if best_score >= self.threshold else (None, best_score)
+
+    def search(self, query, search):
+        """
+        Return (results, matched query) for query: the results of a close
+        earlier query, or those of search(query) with matched query None.
+        A query matching one still in flight waits for it.
+        """
+        terms = query_terms(query)
+        with self._lock:
+            entry, _ = self._match(terms)
+            if entry is None:
+                entry = {"query": query, "terms": terms, "done": threading.Event(), "results": None, "failed": False}
+                self._entries.append(entry)
+                self.searches += 1
+                leader = True
+            else:
+                self.avoided += 1
+                leader = False
+
+        if leader:
+            try:
+                entry["results"] = search(query)
+                return entry["results"], None
+            except Exception:
+                # Forget failed searches so later queries try again
+                entry["failed"] = True
+                with self._lock:
+                    self._entries.remove(entry)
+                raise
+            finally:
+                entry["done"].set()
+
+        entry["done"].wait()
+        if entry["failed"]:
+            with self._lock:
+                self.avoided -= 1
+                self.searches += 1
+            return search(query), None
+        return entry["results"], entry["query"]
+
+
+def _normalize_param(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+class StageCache:
+    """
+    Persistent cache of raw task outputs. Each stage is keyed only on the trip
+    parameters it actually uses, so a request that differs in an unrelated
+    parameter can still reuse it.
+    """
+
+    def __init__(self, path=None, ttl=DAY, max_entries=1000, max_bytes=100 * 1024 * 1024):
+        self.store = TTLCache(
+            path or os.path.join(CACHE_DIR, "plan_cache.sqlite3"),
+            table="stages",
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+        )
+        self.ttl = ttl
+
+    @staticmethod
+    def key(stage, params):
+        normalized = {name: _normalize_param(value) for name, value in sorted(params.items())}
+        return json.dumps([stage, normalized], sort_keys=True)
+
+    def get(self, stage, params):
+        return self.store.get(self.key(stage, params))
+
+    def set(self, stage, params, output):
+        self.store.set(self.key(stage, params), output, self.ttl)
+
+
+class KnowledgeStore:
+    """
+    Persistent store of pre-fetched research per destination and topic.
+    Each entry expires after its topic's TTL, so anything returned is fresh.
+    """
+
+    def __init__(self, path=None, max_entries=20000, max_bytes=200 * 1024 * 1024, topic_ttls=None):
+        self.store = TTLCache(
+            path or os.path.join(CACHE_DIR, "knowledge.sqlite3"),
+            table="knowledge",
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+        )
+        self.topic_ttls = dict(TOPIC_TTLS, **(topic_ttls or {}))
+
+    @staticmethod
+    def key(destination, topic, **params):
+        normalized = {name: _normalize_param(value) for name, value in sorted(params.items())}
+        return json.dumps([_normalize_param(destination), topic, normalized], sort_keys=True)
+
+    def get(self, destination, topic, **params):
+        """
+        Return {"text", "query", "fetched"} for a fresh entry, or None
+        """
+        return self.store.get(self.key(destination, topic, **params))
+
+    def set(self, destination, topic, category, text, query, **params):
+        """
+        Store the research text of a topic for its TTL category's lifetime
+        """
+        value = {"text": text, "query": query, "fetched": time.time()}
+        self.store.set(self.key(destination, topic, **params), value, self.topic_ttls[category])
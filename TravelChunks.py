@@ -0,0 +1,76 @@
+import os
+import re
+from datetime import timedelta
+
+from TravelReplan import heading_level, split_itinerary
+
+# Trips longer than this are planned in chunks of at most this many days (0 plans every trip in one go)
+PLAN_CHUNK_DAYS = int(os.environ.get("TRAVEL_PLAN_CHUNK_DAYS", "5"))
+
+DAYS_HEADING = "**DAY-BY-DAY ITINERARY**"
+
+# Overview sections that come after the day-by-day itinerary
+_AFTER_DAYS = re.compile(r"booking|packing|emergency", re.IGNORECASE)
+
+
+def day_chunks(date_from, date_to, chunk_days=PLAN_CHUNK_DAYS):
+    """
+    Split a trip into chunks of (day number, date) of nearly equal length,
+    none longer than chunk_days. Returns a single chunk if chunk_days is 0.
+    """
+    days = [(i + 1, date_from + timedelta(days=i)) for i in range((date_to - date_from).days + 1)]
+    if chunk_days <= 0 or len(days) <= chunk_days:
+        return [days]
+    count = -(-len(days) // chunk_days)
+    size, extra = divmod(len(days), count)
+    chunks, start = [], 0
+    for i in range(count):
+        end = start + size + (i < extra)
+        chunks.append(days[start:end])
+        start = end
+    return chunks
+
+
+def chunk_label(days):
+    first, last = days[0][0], days[-1][0]
+    return f"day {first}" if first == last else f"days {first}-{last}"
+
+
+def split_focus(digest_text, parts, section="Attractions"):
+    """
+    Deal the lines of one digest section out to parts chunks, round robin,
+    so chunks planned in parallel don't all pick the same highlights
+    """
+    match = re.search(rf"^### {section}\n((?:- .*\n?)+)", digest_text or "", re.MULTILINE)
+    lines = match.group(1).strip().splitlines() if match else []
+    return ["\n".join(lines[i::parts]) for i in range(parts)]
+
+
+def stitch_itinerary(overview, chunks):
+    """
+    Put the day sections of the chunk outputs, in day order, into the
+    overview: under a day-by-day heading, before the booking checklist
+    """
+    days = []
+    for text in chunks:
+        parts = split_itinerary(text)
+        if parts is None:
+            # No day headings: keep the chunk whole, in its place
+            days.append((days[-1][0] if days else 0, text.strip()))
+        else:
+            days += parts[1]
+    blocks = [block for _, block in sorted(days, key=lambda day: day[0])]
+    lines = (overview or "").splitlines()
+    if DAYS_HEADING in (line.strip() for line in lines):
+        # The overview already has the heading: put the days right under it
+        i = [line.strip() for line in lines].index(DAYS_HEADING) + 1
+        before, after = "\n".join(lines[:i]).strip(), "\n".join(lines[i:]).strip()
+        return "\n\n".join(part for part in [before] + blocks + [after] if part)
+
+    section = "\n\n".join([DAYS_HEADING] + blocks)
+    for i, line in enumerate(lines):
+        level = heading_level(line)
+        if level is not None and level <= 2 and _AFTER_DAYS.search(line):
+            before, after = "\n".join(lines[:i]).strip(), "\n".join(lines[i:]).strip()
+            return "\n\n".join(part for part in (before, section, after) if part)
+    return "\n\n".join(part for part in ((overview or "").strip(), section) if part)
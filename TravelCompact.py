@@ -0,0 +1,104 @@
+import os
+import re
+from urllib.parse import urlparse
+
+# Token budget of one compacted search response and of each snippet in it
+SEARCH_TOKEN_BUDGET = int(os.environ.get("TRAVEL_SEARCH_TOKEN_BUDGET", "450"))
+SNIPPET_TOKEN_BUDGET = int(os.environ.get("TRAVEL_SEARCH_SNIPPET_TOKENS", "80"))
+MAX_RESULTS_PER_DOMAIN = int(os.environ.get("TRAVEL_SEARCH_MAX_PER_DOMAIN", "1"))
+
+# Snippets sharing more than this fraction of word shingles are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (roughly 4 tokens per 3 words and punctuation marks)
+    """
+    return len(_TOKEN.findall(text)) * 4 // 3
+
+
+def _domain(url):
+    netloc = urlparse(url or "").netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def _shingles(text, size=3):
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _score(query_words, title, body):
+    # Query words in the title count double
+    title_words = set(_WORD.findall(title.lower()))
+    body_words = set(_WORD.findall(body.lower()))
+    return sum(2 * (word in title_words) + (word in body_words) for word in query_words)
+
+
+def truncate_text(text, budget):
+    """
+    Cut text to roughly budget tokens, preferring to end on a sentence
+    """
+    text = re.sub(r"\s+", " ", text).strip()
+    if estimate_tokens(text) <= budget:
+        return text
+    words = text.split(" ")
+    cut = " ".join(words[:max(1, budget * 3 // 4)])
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    if sentence_end > len(cut) // 2:
+        return cut[:sentence_end + 1]
+    return cut.rstrip(",;:") + "…"
+
+
+def compact_results(query, results, token_budget=SEARCH_TOKEN_BUDGET, snippet_budget=SNIPPET_TOKEN_BUDGET,
+                    max_per_domain=MAX_RESULTS_PER_DOMAIN):
+    """
+    Turn raw search results into a short, ranked text block.
+
+    Results are ranked by overlap with the query, limited to max_per_domain
+    per site, stripped of near-duplicate snippets and truncated so the whole
+    block stays within token_budget. Returns the text and the list of kept
+    results.
+    """
+    query_words = {word for word in _WORD.findall(query.lower()) if len(word) > 2}
+    ranked = sorted(
+        enumerate(results),
+        key=lambda item: (-_score(query_words, item[1].get("title", ""), item[1].get("body", "")), item[0]),
+    )
+
+    kept, seen_shingles, per_domain = [], [], {}
+    lines, used = [], 0
+    for _, result in ranked:
+        domain = _domain(result.get("href"))
+        if per_domain.get(domain, 0) >= max_per_domain:
+            continue
+        shingles = _shingles(result.get("body", ""))
+        if any(_similarity(shingles, other) > NEAR_DUPLICATE_THRESHOLD for other in seen_shingles):
+            continue
+
+        title = truncate_text(result.get("title", ""), 20)
+        snippet = truncate_text(result.get("body", ""), snippet_budget)
+        entry = f"[{len(kept) + 1}] {title} ({domain})\n{snippet}"
+        cost = estimate_tokens(entry)
+        if kept and used + cost > token_budget:
+            break
+        lines.append(entry)
+        used += cost
+        kept.append(result)
+        seen_shingles.append(shingles)
+        per_domain[domain] = per_domain.get(domain, 0) + 1
+
+    if not lines:
+        return "No results found.", kept
+    return "\n".join(lines), kept
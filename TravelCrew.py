@@ -0,0 +1,549 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from crewai import Crew, Process
+from crewai.tasks.task_output import TaskOutput
+
+from TravelAgents import create_planner_expert, default_agents
+from TravelCache import StageCache
+from TravelChunks import PLAN_CHUNK_DAYS, chunk_label, day_chunks, split_focus, stitch_itinerary
+from TravelDigest import DIGEST_TOKEN_BUDGET, build_digest
+from TravelExport import render_days_markdown, render_plan_markdown
+from TravelKnowledge import knowledge_store, stage_knowledge
+from TravelModels import DayPlans, PlanOverview, TravelPlan, merge_days, parse_model, stitch_plan
+from TravelReplan import (changed_inputs, date_extension, day_heading_example, itinerary_outline, merge_itinerary,
+                          split_itinerary)
+from TravelRouting import routing_summary
+from TravelTasks import location_task, guide_task, planner_task, planner_days_task, planner_overview_task
+from TravelTools import search_registry
+from TravelTrace import TRACE_ENABLED, count_tokens, span, submit, tracing
+
+# Execution modes for the planning pipeline
+SEQUENTIAL = "sequential"
+PARALLEL = "parallel"
+
+# Trip parameters each stage depends on; they make up the stage's cache key.
+# The planner reads both research outputs, so it depends on everything.
+STAGE_INPUTS = {
+    "location": ("from_city", "destination_city", "date_from", "date_to"),
+    "guide": ("destination_city", "interests", "date_from", "date_to"),
+    "planner": ("from_city", "destination_city", "interests", "date_from", "date_to"),
+}
+
+# What re-planning does with each stage
+REUSED = "reused"
+RERUN = "rerun"
+EXTENDED = "extended"
+
+# Cache of stage outputs shared by every session (set TRAVEL_PLAN_CACHE=0 to disable)
+PLAN_CACHE_ENABLED = os.environ.get("TRAVEL_PLAN_CACHE", "1") != "0"
+stage_cache = StageCache(
+    ttl=float(os.environ.get("TRAVEL_PLAN_CACHE_TTL", str(24 * 60 * 60))),
+    max_entries=int(os.environ.get("TRAVEL_PLAN_CACHE_MAX_ENTRIES", "1000")),
+) if PLAN_CACHE_ENABLED else None
+
+# Ask the planner for a TravelPlan instead of free-form markdown (set TRAVEL_STRUCTURED_PLAN=0 to disable)
+STRUCTURED_PLAN = os.environ.get("TRAVEL_STRUCTURED_PLAN", "1") != "0"
+
+
+@dataclass
+class StageTiming:
+    """
+    Wall-clock timing of one pipeline stage, relative to the start of the run.
+    parts holds the timings of the chunks of a stage that ran in chunks.
+    """
+    name: str
+    started: float
+    finished: float
+    cached: bool = False
+    parts: list = field(default_factory=list)
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+
+@dataclass
+class PlanEvent:
+    """
+    Progress event emitted while a plan runs.
+    kind is one of "replan", "knowledge", "stage_started", "tool", "thought", "digest" or "stage_finished";
+    output carries the raw task output for "stage_finished" events.
+    """
+    kind: str
+    stage: str
+    message: str
+    output: str = None
+
+
+@dataclass
+class PlanResult:
+    """
+    Raw outputs of the three agents plus the timing of every stage.
+    inputs are the trip parameters of the run; replan maps each stage to
+    REUSED, RERUN or EXTENDED when the run was a re-plan of a previous one.
+    searches counts the searches run and those avoided as near-duplicates.
+    plan is the planner's TravelPlan when its answer was structured, else None.
+    routing has a row per stage and model tier its LLM calls went to (see
+    TravelRouting.routing_summary).
+    """
+    location: str
+    guide: str
+    planner: str
+    mode: str
+    timings: list = field(default_factory=list)
+    total: float = 0.0
+    trace: object = None
+    trace_path: str = None
+    digest: object = None
+    inputs: dict = None
+    replan: dict = None
+    searches: dict = None
+    plan: object = None
+    routing: list = None
+
+    @property
+    def cached_stages(self):
+        return [timing.name for timing in self.timings if timing.cached]
+
+
+def _task_raw(output):
+    return str(output.raw if hasattr(output, "raw") else output)
+
+
+def _task_output(output, model=None):
+    """
+    The answer of a task parsed as model (see TravelTasks.PlanTask), or its
+    raw text if the task has no model or its answer can't be read as one
+    """
+    text = _task_raw(output)
+    structured = parse_model(model, text) if model is not None else None
+    return structured if structured is not None else text
+
+
+def _as_text(output, currency=None):
+    """
+    Markdown of a stage output: structured outputs are rendered, text is kept
+    as is. currency overrides the currency of DayPlans.
+    """
+    if isinstance(output, TravelPlan):
+        return render_plan_markdown(output)
+    if isinstance(output, PlanOverview):
+        return render_plan_markdown(TravelPlan(**output.model_dump()))
+    if isinstance(output, DayPlans):
+        return render_days_markdown(output, currency)
+    return output
+
+
+def _cache_value(output):
+    return {"plan": output.model_dump(mode="json")} if isinstance(output, TravelPlan) else output
+
+
+def _from_cache(value):
+    return TravelPlan.model_validate(value["plan"]) if isinstance(value, dict) else value
+
+
+def _stage_params(stage, inputs):
+    return {name: inputs[name] for name in STAGE_INPUTS[stage]}
+
+
+def _emit(on_event, kind, stage, message, output=None):
+    if on_event is not None:
+        on_event(PlanEvent(kind, stage, message, output))
+
+
+def _step_callback(name, on_event):
+    """
+    Build a crew step callback that reports tool calls and agent thoughts
+    """
+    def callback(step):
+        tool = getattr(step, "tool", None)
+        if tool:
+            tool_input = str(getattr(step, "tool_input", ""))
+            _emit(on_event, "tool", name, f"🔧 {name}: {tool}({tool_input[:160]})")
+            return
+        thought = str(getattr(step, "thought", "") or "").strip()
+        if thought:
+            _emit(on_event, "thought", name, f"💭 {name}: {thought[:200]}")
+    return callback
+
+
+def _run_stage(name, agent, task, run_start, on_event=None, finish=None):
+    """
+    Run a single task in its own crew and time it. The output is the task's
+    structured answer if it has one, else its raw text; finish, if given,
+    turns it into the stage's output.
+    """
+    started = time.perf_counter() - run_start
+    _emit(on_event, "stage_started", name, f"🤖 {agent.role} started")
+    crew = Crew(
+        agents=[agent],
+        tasks=[task],
+        process=Process.sequential,
+        verbose=True,
+        step_callback=_step_callback(name, on_event) if on_event is not None else None,
+    )
+    with span(name, "task", agent=agent.role):
+        output = _task_output(crew.kickoff(), getattr(task, "answer_model", None))
+    if finish is not None:
+        output = finish(output)
+    finished = time.perf_counter() - run_start
+    _emit(on_event, "stage_finished", name, f"✅ {agent.role} finished in {finished - started:.1f}s",
+          _as_text(output))
+    return output, StageTiming(name, started, finished)
+
+
+def _use_cached(name, agent, task, output, run_start, on_event=None, source="a cached result"):
+    """
+    Attach a cached output to a task so later tasks can read it as context
+    """
+    task.output = TaskOutput(description=task.description, raw=_as_text(output), agent=agent.role)
+    with span(name, "task", agent=agent.role, cache="hit"):
+        pass
+    now = time.perf_counter() - run_start
+    _emit(on_event, "stage_finished", name, f"♻️ {agent.role} reused {source}", _as_text(output))
+    return output, StageTiming(name, now, now, cached=True)
+
+
+def _research_digest(results, digest_budget, on_event):
+    """
+    Condense the research outputs into a bounded digest for the planner
+    """
+    with span("digest", "task") as info:
+        digest = build_digest(
+            {"Location Expert": results["location"][0], "Local Guide Expert": results["guide"][0]},
+            token_budget=digest_budget,
+            count=count_tokens,
+        )
+        info.update(source_tokens=digest.source_tokens, digest_tokens=digest.digest_tokens,
+                    saved_tokens=digest.saved_tokens)
+    _emit(on_event, "digest", "planner",
+          f"🗜️ Research digest: {digest.source_tokens} → {digest.digest_tokens} tokens for the planner")
+    return digest
+
+
+def _digest_planner(stages, inputs, results, digest_budget, on_event, structured=False):
+    """
+    Build a planner task that reads a digest of the research instead of the full reports
+    """
+    digest = _research_digest(results, digest_budget, on_event)
+    agent, _ = stages["planner"]
+    task = planner_task(
+        [stages["location"][1], stages["guide"][1]], agent, inputs["destination_city"], inputs["interests"],
+        inputs["date_from"], inputs["date_to"], research_digest=digest.text, structured=structured,
+    )
+    return task, digest
+
+
+def _extension_planner(stages, inputs, results, digest_budget, on_event, itinerary, extension, structured=False):
+    """
+    Build a planner task that plans only the days added to itinerary
+    """
+    digest = _research_digest(results, digest_budget or DIGEST_TOKEN_BUDGET, on_event)
+    agent, _ = stages["planner"]
+    task = planner_days_task(
+        agent, inputs["destination_city"], inputs["interests"], inputs["date_from"], inputs["date_to"],
+        extension.added, digest.text, heading_example=day_heading_example(itinerary),
+        itinerary_outline=itinerary_outline(itinerary), structured=structured,
+    )
+    return task, digest
+
+
+def _run_many(stages, mode, run_start, on_event, thread_name_prefix):
+    """
+    Run {name: (agent, task)} at the same time in parallel mode, otherwise
+    one after the other. Returns {name: (output, timing)}.
+    """
+    if mode == PARALLEL and len(stages) > 1:
+        with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix=thread_name_prefix) as pool:
+            futures = {name: submit(pool, _run_stage, name, *stage, run_start, on_event)
+                       for name, stage in stages.items()}
+            return {name: future.result() for name, future in futures.items()}
+    return {name: _run_stage(name, *stage, run_start, on_event) for name, stage in stages.items()}
+
+
+def _run_chunked_planner(stages, inputs, results, mode, digest_budget, chunks, run_start, on_event,
+                         structured=False):
+    """
+    Plan a long trip in chunks: one task writes the overview sections and
+    one task per chunk of days writes those days, all from the same research
+    digest. The outputs are stitched into a single plan, a TravelPlan if
+    every part was structured and markdown otherwise.
+    """
+    digest = _research_digest(results, digest_budget or DIGEST_TOKEN_BUDGET, on_event)
+    agent, _ = stages["planner"]
+    trip = (inputs["destination_city"], inputs["interests"], inputs["date_from"], inputs["date_to"])
+
+    parts = {"planner overview": (agent, planner_overview_task(agent, *trip, digest.text, structured=structured))}
+    for days, focus in zip(chunks, split_focus(digest.text, len(chunks))):
+        # Tasks running at the same time must not share an agent
+        chunk_agent = create_planner_expert(agent.llm)
+        parts[f"planner {chunk_label(days)}"] = (chunk_agent, planner_days_task(chunk_agent, *trip, days, digest.text,
+                                                                                focus=focus, structured=structured))
+    _emit(on_event, "stage_started", "planner", f"🧩 Planning {len(chunks)} chunks of days plus the overview")
+
+    outputs = _run_many(parts, mode, run_start, on_event, "planner")
+    overview = outputs.pop("planner overview")
+    days = [output for output, _ in outputs.values()]
+    if isinstance(overview[0], PlanOverview) and all(isinstance(output, DayPlans) for output in days):
+        output = stitch_plan(overview[0], days)
+    else:
+        # Label the days in the overview's currency if it was structured
+        currency = overview[0].currency if isinstance(overview[0], PlanOverview) else None
+        output = stitch_itinerary(_as_text(overview[0]), [_as_text(output, currency) for output in days])
+
+    timings = [overview[1]] + [timing for _, timing in outputs.values()]
+    timing = StageTiming("planner", min(part.started for part in timings), max(part.finished for part in timings),
+                         parts=timings)
+    _emit(on_event, "stage_finished", "planner",
+          f"✅ {agent.role} finished {len(chunks)} chunks in {timing.duration:.1f}s", _as_text(output))
+    return (output, timing), digest
+
+
+def _run_stages(stages, inputs, mode, cache, on_event, digest_budget, reuse=None, extend=None,
+                chunk_days=PLAN_CHUNK_DAYS, structured=False):
+    """
+    Run the stages that are not reused or cached. Returns {name: (output, timing)},
+    the wall time of the whole run and the planner's research digest (if any).
+
+    reuse maps stage names to outputs of a previous run to keep; extend is
+    (previous itinerary, previous TravelPlan or None, DateExtension) to plan
+    only the added days. Trips longer than chunk_days are planned in chunks
+    of days. structured asks the planner for a TravelPlan.
+    """
+    run_start = time.perf_counter()
+    results = {}
+    pending = []
+    for name, (agent, task) in stages.items():
+        if reuse and name in reuse:
+            results[name] = _use_cached(name, agent, task, reuse[name], run_start, on_event, "the previous plan")
+            continue
+        cached = cache.get(name, _stage_params(name, inputs)) if cache is not None else None
+        if cached is not None:
+            results[name] = _use_cached(name, agent, task, _from_cache(cached), run_start, on_event)
+        elif name != "planner":
+            pending.append(name)
+
+    results.update(_run_many({name: stages[name] for name in pending}, mode, run_start, on_event, "research"))
+
+    digest = None
+    if "planner" not in results:
+        chunks = day_chunks(inputs["date_from"], inputs["date_to"], chunk_days) if extend is None else []
+        if len(chunks) > 1:
+            results["planner"], digest = _run_chunked_planner(stages, inputs, results, mode, digest_budget, chunks,
+                                                              run_start, on_event, structured)
+        else:
+            agent, task = stages["planner"]
+            if extend is not None:
+                itinerary, plan, extension = extend
+                task, digest = _extension_planner(stages, inputs, results, digest_budget, on_event, itinerary,
+                                                  extension, structured and plan is not None)
+
+                def merge_added(added):
+                    if plan is not None and isinstance(added, DayPlans):
+                        return merge_days(plan, added, extension.offset)
+                    currency = plan.currency if plan is not None else None
+                    return merge_itinerary(itinerary, _as_text(added, currency), extension.offset)
+
+                results["planner"] = _run_stage("planner", agent, task, run_start, on_event, finish=merge_added)
+            else:
+                if digest_budget > 0:
+                    task, digest = _digest_planner(stages, inputs, results, digest_budget, on_event, structured)
+                results["planner"] = _run_stage("planner", agent, task, run_start, on_event)
+
+    if cache is not None:
+        for name, (output, timing) in results.items():
+            if not timing.cached:
+                cache.set(name, _stage_params(name, inputs), _cache_value(output))
+    return results, time.perf_counter() - run_start, digest
+
+
+def plan_changes(previous, inputs):
+    """
+    Decide what a re-plan of previous (a PlanResult) does with each stage.
+
+    A research stage is REUSED unless one of its STAGE_INPUTS changed; when
+    the dates only grow, the research still holds and is reused. The planner
+    is EXTENDED when only the dates grew and the previous itinerary has day
+    sections, and is RERUN when anything else changed.
+    Returns ({stage: action}, DateExtension or None).
+    """
+    changed = changed_inputs(previous.inputs, inputs)
+    extension = date_extension(previous.inputs, inputs)
+    research_changed = changed - {"date_from", "date_to"} if extension is not None else changed
+
+    actions = {}
+    for name in ("location", "guide"):
+        actions[name] = RERUN if research_changed & set(STAGE_INPUTS[name]) else REUSED
+    if not changed:
+        actions["planner"] = REUSED
+    elif extension is not None and not research_changed and split_itinerary(previous.planner) is not None:
+        actions["planner"] = EXTENDED
+    else:
+        actions["planner"] = RERUN
+    return actions, extension if actions["planner"] == EXTENDED else None
+
+
+def _describe_changes(actions, extension):
+    parts = []
+    for name, action in actions.items():
+        if action == EXTENDED:
+            parts.append(f"{name} {action} (+{len(extension.added)} days)")
+        else:
+            parts.append(f"{name} {action}")
+    return "♻️ Re-plan: " + ", ".join(parts)
+
+
+def run_travel_plan(from_city, destination_city, date_from, date_to, interests, mode=PARALLEL, cache=stage_cache,
+                    on_event=None, digest_budget=DIGEST_TOKEN_BUDGET, agents=None, previous=None,
+                    chunk_days=PLAN_CHUNK_DAYS, knowledge=knowledge_store, structured=STRUCTURED_PLAN):
+    """
+    Run the location, guide and planner agents and return their outputs.
+
+    In parallel mode the two research tasks run at the same time, since
+    guide_task never reads location_task's output; planner_task starts once
+    both have finished and picks their outputs up through its context.
+    Stages found in the cache are reused and only the missing ones are run.
+
+    on_event, if given, is called with a PlanEvent as stages start, use tools
+    and finish. It may be called from worker threads.
+
+    With a positive digest_budget the planner gets a digest of the research
+    reports of about that many tokens instead of the full reports.
+
+    agents maps stage names to the agents to use (see TravelAgents.create_agents);
+    plans that run concurrently must not share agents. Without agents the
+    run uses the process's default set (see TravelAgents.default_agents).
+
+    previous, a PlanResult of an earlier run, turns the run into a re-plan:
+    only the stages whose inputs changed are run again, and when the dates
+    were only extended the planner plans just the added days and merges them
+    into the previous itinerary (see plan_changes).
+
+    Trips longer than chunk_days (0 disables chunking) are planned in chunks:
+    the overview sections and each chunk of days are written by separate
+    planner tasks from a shared research digest, in parallel mode at the
+    same time, and stitched into one plan.
+
+    knowledge is the store of pre-fetched destination research (see
+    TravelKnowledge). The research tasks get its fresh topics and only search
+    the rest; None searches everything live.
+
+    With structured the planner answers with a TravelPlan (see TravelModels),
+    returned as result.plan and rendered to markdown as result.planner. If the
+    answer can't be read as one, the run keeps its raw text as the itinerary
+    and result.plan is None.
+    """
+    inputs = {
+        "from_city": from_city,
+        "destination_city": destination_city,
+        "date_from": date_from,
+        "date_to": date_to,
+        "interests": interests,
+    }
+    if agents is None:
+        agents = default_agents()
+    prefetched = {name: stage_knowledge(name, inputs, knowledge) for name in ("location", "guide")}
+    for name, found in prefetched.items():
+        if found.found:
+            _emit(on_event, "knowledge", name, f"📚 {agents[name].role}: {len(found.found)} of "
+                  f"{len(found.found) + len(found.missing)} topics pre-fetched")
+    loc_task = location_task(agents["location"], from_city, destination_city, date_from, date_to,
+                             prefetched["location"].prompt(), prefetched["location"].missing)
+    guid_task = guide_task(agents["guide"], destination_city, interests, date_from, date_to,
+                           prefetched["guide"].prompt(), prefetched["guide"].missing)
+    plan_task = planner_task([loc_task, guid_task], agents["planner"], destination_city, interests, date_from, date_to,
+                             structured=structured)
+    stages = {
+        "location": (agents["location"], loc_task),
+        "guide": (agents["guide"], guid_task),
+        "planner": (agents["planner"], plan_task),
+    }
+
+    actions, reuse, extend = None, None, None
+    if previous is not None and previous.inputs is not None:
+        actions, extension = plan_changes(previous, inputs)
+        reuse = {name: getattr(previous, name) for name, action in actions.items() if action == REUSED}
+        if actions["planner"] == REUSED and previous.plan is not None:
+            reuse["planner"] = previous.plan
+        extend = (previous.planner, previous.plan, extension) if extension is not None else None
+        _emit(on_event, "replan", "plan", _describe_changes(actions, extension))
+
+    prefetched_topics = sum(len(found.found) for found in prefetched.values())
+    with tracing(f"{from_city}-{destination_city}") as tracer, \
+            span("plan", "run", mode=mode, replan=bool(actions), prefetched_topics=prefetched_topics) as info, \
+            search_registry() as registry:
+        results, total, digest = _run_stages(stages, inputs, mode, cache, on_event, digest_budget, reuse, extend,
+                                             chunk_days, structured)
+        searches = {"run": registry.searches, "avoided": registry.avoided} if registry is not None else None
+        info.update(searches=searches)
+    trace_path = tracer.save() if TRACE_ENABLED else None
+
+    return PlanResult(
+        location=results["location"][0],
+        guide=results["guide"][0],
+        planner=_as_text(results["planner"][0]),
+        mode=mode,
+        timings=[results[name][1] for name in stages],
+        total=total,
+        trace=tracer,
+        trace_path=trace_path,
+        digest=digest,
+        inputs=inputs,
+        replan=actions,
+        searches=searches,
+        plan=results["planner"][0] if isinstance(results["planner"][0], TravelPlan) else None,
+        routing=routing_summary(tracer.spans),
+    )
+
+
+def trace_summary(result):
+    """
+    Summary rows of a run's trace: time, tokens and cache hits per span name
+    """
+    return result.trace.summary() if result.trace is not None else []
+
+
+def format_timing_report(result):
+    """
+    Render the per-stage timings of a run as a markdown table
+    """
+    lines = [
+        "| Stage | Start (s) | End (s) | Duration (s) |",
+        "|---|---|---|---|",
+    ]
+    replan = result.replan or {}
+    for timing in result.timings:
+        name = timing.name
+        if replan.get(name) in (REUSED, EXTENDED):
+            name = f"{name} ({replan[name]})"
+        elif timing.cached:
+            name = f"{name} (cached)"
+        lines.append(f"| {name} | {timing.started:.1f} | {timing.finished:.1f} | {timing.duration:.1f} |")
+        for part in timing.parts:
+            lines.append(f"| &nbsp;&nbsp;↳ {part.name} | {part.started:.1f} | {part.finished:.1f} | "
+                         f"{part.duration:.1f} |")
+
+    # Sum of stage (or chunk) durations is what a sequential run would have cost
+    stage_total = sum(sum(part.duration for part in timing.parts) if timing.parts else timing.duration
+                      for timing in result.timings)
+    lines.append("")
+    lines.append(f"**Mode:** {result.mode} &nbsp; | &nbsp; **Wall time:** {result.total:.1f}s "
+                 f"&nbsp; | &nbsp; **Sum of stages:** {stage_total:.1f}s")
+    if result.total > 0:
+        lines.append(f"**Overlap speedup:** {stage_total / result.total:.2f}x")
+    if result.searches:
+        lines.append(f"**Searches:** {result.searches['run']} run, {result.searches['avoided']} avoided as "
+                     f"near-duplicates of earlier ones")
+    if result.routing:
+        models = ", ".join(f"{row['stage']} → {row['tier']} ×{row['calls']}" for row in result.routing)
+        fallbacks = sum(row["fallbacks"] for row in result.routing)
+        cost = sum(row["cost_usd"] for row in result.routing)
+        lines.append(f"**Models:** {models} &nbsp; | &nbsp; **Fallbacks to a faster tier:** {fallbacks} "
+                     f"&nbsp; | &nbsp; **Estimated LLM cost:** ${cost:.4f}")
+    if result.digest is not None:
+        lines.append(f"**Planner context:** {result.digest.source_tokens} → {result.digest.digest_tokens} tokens "
+                     f"(saved {result.digest.saved_tokens})")
+    return "\n".join(lines)
@@ -0,0 +1,123 @@
+import os
+import re
+from dataclasses import dataclass
+
+from TravelCompact import estimate_tokens, truncate_text
+
+# Token budget of the research digest handed to planner_task (0 hands over the full reports)
+DIGEST_TOKEN_BUDGET = int(os.environ.get("TRAVEL_DIGEST_TOKENS", "1500"))
+DIGEST_ITEM_TOKENS = 45
+
+# Digest sections with their share of the budget and the keywords that select lines for them
+DIGEST_SECTIONS = [
+    ("Attractions", 0.25, ("attraction", "museum", "landmark", "gallery", "church", "basilica", "palace",
+                           "park", "monument", "tour", "hidden gem", "viewpoint", "neighborhood",
+                           "neighbourhood", "market", "shopping", "festival", "event", "nightlife")),
+    ("Restaurants", 0.2, ("restaurant", "trattoria", "cafe", "café", "bar", "dish", "food", "cuisine",
+                          "eat", "dinner", "lunch", "breakfast", "street food", "gelato", "wine")),
+    ("Transport", 0.15, ("flight", "airport", "airline", "metro", "bus", "tram", "train", "taxi", "uber",
+                         "transport", "ticket", "pass", "walk", "transfer", "ride")),
+    ("Costs", 0.2, ("cost", "price", "budget", "€", "$", "£", "₹", "eur", "usd", "inr", "currency",
+                    "exchange", "fee", "per night", "per person", "hotel", "hostel", "accommodation")),
+    ("Essentials", 0.2, ("visa", "passport", "weather", "temperature", "rain", "climate", "safety", "safe",
+                         "scam", "emergency", "embassy", "hospital", "police", "pack", "etiquette", "tip")),
+]
+
+# Keywords only match at the start of a word ("pass" matches "passes", not "bypass")
+_SECTION_PATTERNS = [
+    (name, re.compile(r"(?<!\w)(?:" + "|".join(re.escape(keyword) for keyword in keywords) + ")"))
+    for name, _, keywords in DIGEST_SECTIONS
+]
+
+_MARKDOWN = re.compile(r"^\s*(?:[-*+•]|\d+[.)]|#+)\s*")
+_EMPHASIS = re.compile(r"[*_`]+")
+
+
+@dataclass
+class ResearchDigest:
+    """
+    Bounded digest of the research reports, with token counts before and after
+    """
+    text: str
+    source_tokens: int
+    digest_tokens: int
+
+    @property
+    def saved_tokens(self):
+        return max(0, self.source_tokens - self.digest_tokens)
+
+
+def _report_lines(report):
+    """
+    Yield (heading, line) for every content line of a markdown report
+    """
+    heading = ""
+    for raw in report.splitlines():
+        is_heading = raw.lstrip().startswith("#") or (raw.strip().startswith("**") and raw.strip().endswith("**"))
+        line = _EMPHASIS.sub("", _MARKDOWN.sub("", raw)).strip(" :-")
+        if not line:
+            continue
+        if is_heading:
+            heading = line.lower()
+            continue
+        yield heading, line
+
+
+def _section_of(heading, line):
+    # The heading a line sits under says more about it than the line itself
+    line = line.lower()
+    best, best_hits = None, 0
+    for name, pattern in _SECTION_PATTERNS:
+        hits = 2 * len(pattern.findall(heading)) + len(pattern.findall(line))
+        if hits > best_hits:
+            best, best_hits = name, hits
+    return best
+
+
+def _score(line):
+    # Concrete lines (prices, times, names) are the most useful to the planner
+    score = 2 * bool(re.search(r"\d", line))
+    score += min(3, len(re.findall(r"\b[A-Z][a-z]+", line)))
+    if len(line.split()) < 4:
+        score -= 2
+    return score
+
+
+def build_digest(reports, token_budget=DIGEST_TOKEN_BUDGET, count=estimate_tokens):
+    """
+    Extract a structured digest (attractions, restaurants, transport, costs,
+    essentials) from the research reports, within roughly token_budget tokens.
+
+    reports maps a source name (e.g. "Location Expert") to its raw report.
+    count is the function used for the before/after token counts.
+    """
+    candidates = {name: [] for name, _, _ in DIGEST_SECTIONS}
+    seen = set()
+    position = 0
+    for report in reports.values():
+        for heading, line in _report_lines(report or ""):
+            key = re.sub(r"\W+", " ", line.lower()).strip()
+            section = _section_of(heading, line)
+            if section is None or key in seen:
+                continue
+            seen.add(key)
+            candidates[section].append((_score(line), position, truncate_text(line, DIGEST_ITEM_TOKENS)))
+            position += 1
+
+    parts = []
+    for name, share, _ in DIGEST_SECTIONS:
+        budget = int(token_budget * share)
+        picked, used = [], 0
+        for score, position, line in sorted(candidates[name], key=lambda item: (-item[0], item[1])):
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                continue
+            picked.append((position, line))
+            used += cost
+        if picked:
+            # Keep the reports' original order within each section
+            parts.append(f"### {name}\n" + "\n".join(f"- {line}" for _, line in sorted(picked)))
+
+    text = "\n\n".join(parts)
+    source = "\n\n".join(report or "" for report in reports.values())
+    return ResearchDigest(text=text, source_tokens=count(source), digest_tokens=count(text))
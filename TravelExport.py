@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from jinja2 import DictLoader, Environment
+
+# Itinerary as shown in the app
+PLAN_TEMPLATE = """\
+**EXECUTIVE SUMMARY**
+
+{{ plan.summary }}
+{% for highlight in plan.highlights %}
+- {{ highlight }}
+{% endfor %}
+
+**Estimated budget:** {{ plan.total_cost | money(plan.currency) }} per person \
+({{ plan.daily_total | money(plan.currency) }} for the days, the rest for trip-level costs)
+{% for category, amount in plan.budget_by_category().items() %}
+- {{ category | capitalize }}: {{ amount | money(plan.currency) }}
+{% endfor %}
+{% if plan.accommodations %}
+
+**ACCOMMODATION OPTIONS**
+
+| Name | Area | Per night | Pros | Cons |
+|---|---|---|---|---|
+{% for stay in plan.accommodations %}
+| {{ stay.name }} | {{ stay.area }} | {{ stay.price_per_night | money(plan.currency) }} | \
+{{ stay.pros }} | {{ stay.cons }} |
+{% endfor %}
+{% endif %}
+
+**DAY-BY-DAY ITINERARY**
+{% include "days.md" %}
+{% if plan.bookings %}
+
+**BOOKING CHECKLIST**
+
+{% for booking in plan.bookings %}
+- [ ] {{ booking.item }} ({{ booking.kind }}){% if booking.link %} - {{ booking.link }}{% endif %}\
+{% if booking.note %} - {{ booking.note }}{% endif %}
+
+{% endfor %}
+{% endif %}
+{% if plan.packing_list %}
+
+**PACKING LIST**
+
+{% for item in plan.packing_list %}
+- {{ item }}
+{% endfor %}
+{% endif %}
+{% if plan.emergency_info %}
+
+**EMERGENCY INFORMATION**
+
+{% for item in plan.emergency_info %}
+- {{ item }}
+{% endfor %}
+{% endif %}
+"""
+
+# Day sections of a plan; a "## Day N - date" heading per day so re-plans can find the days
+DAYS_TEMPLATE = """\
+{% for day in plan.days %}
+
+## Day {{ day.day }} - {{ day.date }}{% if day.title %}: {{ day.title }}{% endif %}
+
+{% for activity in day.activities %}
+- **{{ activity.time }}** {{ activity.title }}{% if activity.location %} ({{ activity.location }}){% endif %}\
+{% if activity.cost %} - {{ activity.cost | money(plan.currency) }}{% endif %}\
+{% if activity.booking_required %} 🎟️ book ahead{% endif %}
+
+{% if activity.description %}
+  {{ activity.description }}
+{% endif %}
+{% endfor %}
+{% if day.transport_notes %}
+- 🚇 {{ day.transport_notes }}
+{% endif %}
+- 💰 Day budget: {{ day.budget | money(plan.currency) }}
+{% endfor %}
+"""
+
+# Full report offered as a download
+REPORT_TEMPLATE = """\
+
+# 🌍 AI-POWERED TRIP PLAN TO {{ trip.destination_city | upper }}
+
+**Generated on:** {{ generated }}
+**Trip Duration:** {{ trip.date_from }} to {{ trip.date_to }}
+
+---
+
+## 📍 LOCATION INFORMATION
+{{ location or 'See full itinerary below' }}
+
+---
+
+## 🎯 LOCAL GUIDE RECOMMENDATIONS
+{{ guide or 'See full itinerary below' }}
+
+---
+
+## ✈️ COMPLETE TRAVEL ITINERARY
+{{ itinerary }}
+
+---
+
+**Interests:** {{ trip.interests }}
+**Traveling from:** {{ trip.from_city }}
+**Destination:** {{ trip.destination_city }}
+"""
+
+# One row per activity, so spreadsheets can total the budget by day or category
+CSV_TEMPLATE = """\
+{{ ["day", "date", "time", "title", "location", "category", "cost", "currency", "booking_required"] | csv_row }}
+{% for day in plan.days %}
+{% for activity in day.activities %}
+{{ [day.day, day.date, activity.time, activity.title, activity.location, activity.category, activity.cost,
+    plan.currency, activity.booking_required] | csv_row }}
+{% endfor %}
+{% endfor %}
+{% for cost in plan.costs %}
+{{ ["", "", "", cost.category, cost.note, "trip", cost.amount, plan.currency, false] | csv_row }}
+{% endfor %}
+"""
+
+# Summary used when the planner's answer could not be read as a TravelPlan
+SUMMARY_CSV_TEMPLATE = """\
+{{ ["Attribute", "Value"] | csv_row }}
+{{ ["From City", trip.from_city] | csv_row }}
+{{ ["Destination", trip.destination_city] | csv_row }}
+{{ ["Departure Date", trip.date_from] | csv_row }}
+{{ ["Return Date", trip.date_to] | csv_row }}
+{{ ["Interests", trip.interests] | csv_row }}
+{{ ["Generated", generated] | csv_row }}
+"""
+
+
+def _money(amount, currency="EUR"):
+    return f"{amount:,.0f} {currency}"
+
+
+def _csv_row(values):
+    # Let the csv module do the quoting
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(values)
+    return buffer.getvalue()
+
+
+_env = Environment(
+    loader=DictLoader({
+        "plan.md": PLAN_TEMPLATE,
+        "days.md": DAYS_TEMPLATE,
+        "report.md": REPORT_TEMPLATE,
+        "plan.csv": CSV_TEMPLATE,
+        "summary.csv": SUMMARY_CSV_TEMPLATE,
+    }),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+)
+_env.filters["money"] = _money
+_env.filters["csv_row"] = _csv_row
+
+
+def _render(name, **context):
+    return _env.get_template(name).render(**context)
+
+
+def _generated():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def render_plan_markdown(plan):
+    """
+    Render a TravelPlan as the markdown itinerary shown in the app
+    """
+    return _render("plan.md", plan=plan).strip()
+
+
+def render_days_markdown(days, currency=None):
+    """
+    Render DayPlans (some days planned on their own) as markdown day sections,
+    with amounts in currency (default: the currency of days)
+    """
+    return _render("days.md", plan={"days": days.days, "currency": currency or days.currency}).strip()
+
+
+def render_report(trip, location, guide, itinerary):
+    """
+    Render the downloadable report: research reports plus the itinerary.
+    trip holds the trip parameters (from_city, destination_city, date_from,
+    date_to, interests).
+    """
+    return _render("report.md", trip=trip, location=location, guide=guide, itinerary=itinerary,
+                   generated=_generated())
+
+
+def render_csv(trip, plan=None):
+    """
+    Render the plan's activities and trip-level costs as CSV, or a summary
+    of the trip parameters if there is no structured plan
+    """
+    if plan is None:
+        return _render("summary.csv", trip=trip, generated=_generated())
+    return _render("plan.csv", plan=plan)
+
+
+def render_json(trip, plan):
+    """
+    Render the trip parameters, the plan and its budget rollups as JSON
+    """
+    document = {
+        "trip": {name: str(value) for name, value in trip.items()},
+        "generated": _generated(),
+        "plan": plan.model_dump(mode="json"),
+        "budget": {
+            "currency": plan.currency,
+            "total": plan.total_cost,
+            "by_category": plan.budget_by_category(),
+            "by_day": {day.date: day.budget for day in plan.days},
+        },
+    }
+    return json.dumps(document, ensure_ascii=False, indent=2)
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Per-process limits: plans running at once, plans waiting, and how long finished jobs are kept
+MAX_RUNNING_JOBS = int(os.environ.get("TRAVEL_MAX_RUNNING_JOBS", "2"))
+MAX_QUEUED_JOBS = int(os.environ.get("TRAVEL_MAX_QUEUED_JOBS", "20"))
+JOB_TTL = float(os.environ.get("TRAVEL_JOB_TTL", str(60 * 60)))
+
+
+class JobLimitError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue is full
+    """
+
+
+@dataclass
+class Job:
+    """
+    A plan running in the background. events and outputs fill up while it runs.
+    """
+    id: str
+    inputs: dict
+    status: str = QUEUED
+    events: list = field(default_factory=list)
+    outputs: dict = field(default_factory=dict)
+    result: object = None
+    error: str = None
+    details: str = None
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    """
+    Runs plans on a bounded thread pool, independent of the Streamlit script
+    thread, so reruns and reconnects neither block nor cancel them.
+    """
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS, ttl=JOB_TTL):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="plan-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, inputs):
+        """
+        Queue fn(inputs, on_event) as a job and return it. on_event receives
+        the pipeline's PlanEvents; "stage_finished" events fill job.outputs.
+        """
+        with self._lock:
+            self._expire()
+            active = sum(not job.done for job in self._jobs.values())
+            if active >= self.max_running + self.max_queued:
+                raise JobLimitError(f"Too many plans in progress ({active}), please try again in a minute")
+            job = Job(id=uuid.uuid4().hex[:12], inputs=dict(inputs))
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """
+        Number of queued jobs ahead of job
+        """
+        with self._lock:
+            return sum(other.status == QUEUED and other.created < job.created for other in self._jobs.values())
+
+    def _run(self, job, fn):
+        job.status = RUNNING
+        job.started = time.time()
+
+        def on_event(event):
+            job.events.append(event)
+            if event.kind == "stage_finished":
+                job.outputs[event.stage] = event.output
+
+        try:
+            job.result = fn(job.inputs, on_event)
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.details = traceback.format_exc()
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and now - job.finished > self.ttl]:
+            del self._jobs[job_id]
@@ -0,0 +1,216 @@
+"""
+Destination knowledge prefetcher.
+
+Searches the research topics of location_task and guide_task ahead of time
+for a list of popular destinations and keeps the results in a knowledge
+store, each topic with its own freshness window. Research tasks for those
+destinations then start from the stored results and only search the topics
+that are missing or stale. Topics still fresh are skipped, so the command
+is cheap to run often, e.g. hourly from cron:
+
+    python TravelKnowledge.py --cities Rome,Paris,Tokyo --origins "New Delhi,London" --months 3
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+
+from TravelCache import KnowledgeStore
+
+# Research topics that can be fetched ahead of time: (stage, topic, TTL category, query).
+# Queries using {origin} are fetched per origin city, those using {month} per travel month.
+KNOWLEDGE_TOPICS = [
+    ("location", "Visa Requirements", "visa", "{origin} citizens visa requirements for {destination}"),
+    ("location", "Flight Options", "flights", "flights from {origin} to {destination} prices"),
+    ("location", "Local Transportation", "transport", "{destination} metro bus taxi prices"),
+    ("location", "Weather", "weather", "{destination} weather in {month}"),
+    ("location", "Safety Information", "safety", "{destination} travel safety advisory"),
+    ("location", "Currency & Budget", "prices", "{destination} currency exchange rate cost of living"),
+    ("guide", "Top Attractions", "attractions", "{destination} top attractions"),
+    ("guide", "Local Restaurants", "restaurants", "{destination} best local restaurants"),
+    ("guide", "Cultural Experiences", "events", "{destination} events and festivals in {month}"),
+    ("guide", "Hidden Gems", "attractions", "{destination} hidden gems locals love"),
+    ("guide", "Food Recommendations", "restaurants", "{destination} local dishes to try"),
+    ("guide", "Nightlife/Entertainment", "restaurants", "{destination} nightlife bars live music"),
+    ("guide", "Shopping Areas", "attractions", "{destination} markets and shopping areas"),
+]
+
+
+def _city_list(value):
+    return [city.strip() for city in value.split(",") if city.strip()]
+
+
+# Destinations, origin cities and months ahead to prefetch (comma-separated lists)
+PREFETCH_CITIES = _city_list(os.environ.get("TRAVEL_PREFETCH_CITIES", ""))
+PREFETCH_ORIGINS = _city_list(os.environ.get("TRAVEL_PREFETCH_ORIGINS", ""))
+PREFETCH_MONTHS = int(os.environ.get("TRAVEL_PREFETCH_MONTHS", "3"))
+
+# Knowledge store read by the research tasks (set TRAVEL_KNOWLEDGE=0 to disable)
+KNOWLEDGE_ENABLED = os.environ.get("TRAVEL_KNOWLEDGE", "1") != "0"
+knowledge_store = KnowledgeStore() if KNOWLEDGE_ENABLED else None
+
+
+@dataclass
+class StageKnowledge:
+    """
+    Fresh pre-fetched research for one stage, and the topics it lacks
+    """
+    found: dict = field(default_factory=dict)
+    missing: list = field(default_factory=list)
+
+    @property
+    def complete(self):
+        return bool(self.found) and not self.missing
+
+    def prompt(self):
+        """
+        Text block handed to the research task, or None if nothing was found
+        """
+        if not self.found:
+            return None
+        now = time.time()
+        parts = []
+        for topic, entry in self.found.items():
+            age = max(0, int((now - entry["fetched"]) / 3600))
+            parts.append(f"### {topic} (searched \"{entry['query']}\", {age}h ago)\n{entry['text']}")
+        return "\n\n".join(parts)
+
+
+def _month(day, ahead=0):
+    # First day of the month, ahead months later
+    index = day.year * 12 + day.month - 1 + ahead
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def trip_months(date_from, date_to):
+    """
+    First day of every month the trip touches
+    """
+    months = [_month(date_from)]
+    while _month(months[-1], 1) <= date_to:
+        months.append(_month(months[-1], 1))
+    return months
+
+
+def _params(query, origin, month):
+    # Only the parameters a topic's query uses are part of its key
+    params = {}
+    if "{origin}" in query:
+        params["origin"] = origin
+    if "{month}" in query:
+        params["month"] = month
+    return params
+
+
+def _topic_entries(stage, destination, origin, months):
+    """
+    Yield (topic, category, query, params) for every entry a stage needs
+    """
+    for topic_stage, topic, category, template in KNOWLEDGE_TOPICS:
+        if topic_stage != stage:
+            continue
+        for month in (months if "{month}" in template else months[:1]):
+            query = template.format(destination=destination, origin=origin, month=f"{month:%B %Y}")
+            yield topic, category, query, _params(template, origin, month)
+
+
+def stage_knowledge(stage, inputs, store=knowledge_store):
+    """
+    Look up the fresh pre-fetched research for a stage of a trip. A topic
+    that spans several travel months is only found if every month is fresh.
+    """
+    knowledge = StageKnowledge()
+    if store is None:
+        return knowledge
+    months = trip_months(inputs["date_from"], inputs["date_to"])
+    entries = {}
+    for topic, _, _, params in _topic_entries(stage, inputs["destination_city"], inputs["from_city"], months):
+        entries.setdefault(topic, []).append(store.get(inputs["destination_city"], topic, **params))
+    for topic, found in entries.items():
+        if all(found):
+            text = "\n\n".join(entry["text"] for entry in found)
+            knowledge.found[topic] = dict(found[0], text=text)
+        else:
+            knowledge.missing.append(topic)
+    return knowledge
+
+
+def fetch_live(query):
+    """
+    Search live, bypassing the search cache so stored topics are as fresh
+    as their fetch time says, and return the compact result text
+    """
+    from TravelCompact import compact_results
+    from TravelTools import live_search
+
+    text, _ = compact_results(query, live_search(query))
+    return text
+
+
+def prefetch(destinations, origins=(), months=PREFETCH_MONTHS, store=knowledge_store, search=None, force=False,
+             today=None, log=print):
+    """
+    Search every knowledge topic for destinations (origin-specific topics for
+    each of origins, month-specific ones for the next months months) and
+    store the results. Topics that are still fresh are skipped unless force.
+    search(query) returns the text to store (default: fetch_live).
+    Returns a dict with the number of topics fetched, fresh and failed.
+    """
+    from TravelTools import search_many
+    search = search or fetch_live
+
+    travel_months = [_month(today or date.today(), ahead) for ahead in range(max(1, months))]
+    stats = {"fetched": 0, "fresh": 0, "failed": 0}
+
+    wanted, seen = {}, set()
+    for destination in destinations:
+        for origin in origins or [None]:
+            for stage in ("location", "guide"):
+                for topic, category, query, params in _topic_entries(stage, destination, origin, travel_months):
+                    key = KnowledgeStore.key(destination, topic, **params)
+                    if (origin is None and "origin" in params) or key in seen:
+                        continue
+                    seen.add(key)
+                    if not force and store.get(destination, topic, **params) is not None:
+                        stats["fresh"] += 1
+                        continue
+                    wanted.setdefault(query, []).append((destination, topic, category, params))
+
+    log(f"{len(wanted)} topics to search, {stats['fresh']} still fresh")
+    for query, response in search_many(list(wanted), search=search).items():
+        text = response.get("results")
+        if not text or str(text).startswith("No results found"):
+            stats["failed"] += 1
+            log(f"[failed] {query}: {response.get('error', 'no results')}")
+            continue
+        for destination, topic, category, params in wanted[query]:
+            store.set(destination, topic, category, text, query, **params)
+        stats["fetched"] += 1
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch research for popular destinations into the knowledge store.")
+    parser.add_argument("--cities", type=_city_list, default=PREFETCH_CITIES,
+                        help="destinations to prefetch (default: TRAVEL_PREFETCH_CITIES)")
+    parser.add_argument("--origins", type=_city_list, default=PREFETCH_ORIGINS,
+                        help="origin cities for visa and flight topics (default: TRAVEL_PREFETCH_ORIGINS)")
+    parser.add_argument("--months", type=int, default=PREFETCH_MONTHS,
+                        help=f"travel months ahead for weather and events (default: {PREFETCH_MONTHS})")
+    parser.add_argument("--force", action="store_true", help="search again even if topics are still fresh")
+    args = parser.parse_args(argv)
+
+    if knowledge_store is None:
+        print("The knowledge store is disabled (TRAVEL_KNOWLEDGE=0)")
+        return 1
+    if not args.cities:
+        parser.error("no destinations: pass --cities or set TRAVEL_PREFETCH_CITIES")
+    stats = prefetch(args.cities, args.origins, args.months, force=args.force)
+    print(f"Done: {stats['fetched']} fetched, {stats['fresh']} still fresh, {stats['failed']} failed")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import email.utils
+import multiprocessing
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, str(default)))
+
+
+# Per-backend limits for this process: calls per second, burst size and
+# how many calls may be in flight at once
+BACKEND_LIMITS = {
+    "llm": (
+        _env_float("TRAVEL_LLM_RATE", 2),
+        _env_float("TRAVEL_LLM_BURST", 4),
+        int(_env_float("TRAVEL_LLM_CONCURRENCY", 4)),
+    ),
+    "search": (
+        _env_float("TRAVEL_SEARCH_RATE", 1),
+        _env_float("TRAVEL_SEARCH_BURST", 3),
+        int(_env_float("TRAVEL_SEARCH_CONCURRENCY", 3)),
+    ),
+}
+
+# Retry policy for rate-limited or transiently failing calls
+RETRY_ATTEMPTS = int(_env_float("TRAVEL_RETRY_ATTEMPTS", 4))
+RETRY_BASE_DELAY = _env_float("TRAVEL_RETRY_BASE_DELAY", 1)
+RETRY_MAX_DELAY = _env_float("TRAVEL_RETRY_MAX_DELAY", 30)
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Limiter shared with other processes, installed by the batch planner
+_limiter = None
+
+
+def install_limiter(limiter):
+    """
+    Install the limiter used by throttle(). Pass None to remove it.
+    """
+    global _limiter
+    _limiter = limiter
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` calls per second on average,
+    with bursts of up to `capacity` calls.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = max(1.0, capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, backend=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Rate limiter shared by every process that inherits it, e.g. through a
+    worker pool initializer. Calls are spaced 1/rate seconds apart across all
+    processes and backends combined.
+    """
+
+    def __init__(self, rate):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.interval = 1.0 / rate
+        self._next_slot = multiprocessing.Value("d", 0.0)
+
+    def acquire(self, backend=None):
+        with self._next_slot.get_lock():
+            now = time.time()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Process-wide limiters, one per backend
+_buckets = {backend: TokenBucket(rate, burst) for backend, (rate, burst, _) in BACKEND_LIMITS.items() if rate > 0}
+_slots = {backend: threading.BoundedSemaphore(max(1, concurrency))
+          for backend, (_, _, concurrency) in BACKEND_LIMITS.items()}
+
+
+def throttle(backend):
+    """
+    Block until both the backend's token bucket and the installed shared
+    limiter (if any) allow one more call to backend ("llm" or "search").
+    """
+    bucket = _buckets.get(backend)
+    if bucket is not None:
+        bucket.acquire(backend)
+    if _limiter is not None:
+        _limiter.acquire(backend)
+
+
+@contextmanager
+def backend_slot(backend):
+    """
+    Hold one of the backend's concurrency slots for the duration of a call
+    """
+    slot = _slots.get(backend)
+    if slot is None:
+        throttle(backend)
+        yield
+        return
+    with slot:
+        throttle(backend)
+        yield
+
+
+def _status_code(error):
+    # httpx and provider SDKs use status_code, urllib's HTTPError uses status
+    for obj in (error, getattr(error, "response", None)):
+        for name in ("status_code", "status"):
+            code = getattr(obj, name, None)
+            if isinstance(code, int):
+                return code
+    return None
+
+
+def is_retryable(error):
+    """
+    True for rate limits, timeouts and transient server or connection errors
+    """
+    code = _status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    name = type(error).__name__.lower()
+    return any(word in name for word in ("ratelimit", "timeout", "connection", "unavailable"))
+
+
+def retry_after(error):
+    """
+    Return the delay in seconds requested by a Retry-After header, or None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt):
+    """
+    Exponential backoff with full jitter for the given (zero-based) attempt
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def call_with_retry(backend, fn, *args, **kwargs):
+    """
+    Call fn under the backend's limits, retrying retryable errors with
+    jittered exponential backoff or the server's Retry-After delay
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            with backend_slot(backend):
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+            delay = retry_after(e)
+            time.sleep(min(delay, RETRY_MAX_DELAY * 2) if delay is not None else backoff_delay(attempt))
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def http_client():
+    """
+    Return the process-wide pooled httpx client used for LLM requests
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+
+            concurrency = BACKEND_LIMITS["llm"][2]
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=max(10, concurrency * 2), max_keepalive_connections=concurrency),
+                timeout=httpx.Timeout(_env_float("TRAVEL_LLM_TIMEOUT", 120), connect=10),
+            )
+        return _http_client
@@ -0,0 +1,134 @@
+from pydantic import BaseModel, Field, ValidationError
+
+
+class Activity(BaseModel):
+    """
+    One entry of a day: a visit, a meal, a transfer or a check-in
+    """
+    time: str = Field(description="Start time (e.g. 09:00) or part of the day (Morning, Lunch, Evening)")
+    title: str = Field(description="What the traveler does, e.g. 'Colosseum and Roman Forum'")
+    location: str = Field("", description="Place or neighborhood")
+    description: str = Field("", description="Short practical description")
+    category: str = Field("activity", description="One of: activity, meal, transport, accommodation")
+    cost: float = Field(0.0, description="Estimated cost per person, in the plan's currency")
+    booking_required: bool = Field(False, description="Whether it must be booked in advance")
+
+
+class DayPlan(BaseModel):
+    """
+    The schedule of one day of the trip
+    """
+    day: int = Field(description="Day number, starting at 1 on the departure date")
+    date: str = Field(description="Date of the day (YYYY-MM-DD)")
+    title: str = Field("", description="Theme of the day, e.g. 'Ancient Rome'")
+    activities: list[Activity] = Field(default_factory=list, description="Activities and meals in time order")
+    transport_notes: str = Field("", description="How to get between the day's places")
+
+    @property
+    def budget(self):
+        return sum(activity.cost for activity in self.activities)
+
+
+class Accommodation(BaseModel):
+    name: str
+    area: str = ""
+    price_per_night: float = Field(0.0, description="Price per night, in the plan's currency")
+    pros: str = ""
+    cons: str = ""
+
+
+class Booking(BaseModel):
+    item: str = Field(description="What to book")
+    kind: str = Field("activity", description="One of: activity, restaurant, transport, accommodation")
+    link: str = Field("", description="Booking link or contact")
+    note: str = Field("", description="When to book and anything else to know")
+
+
+class CostItem(BaseModel):
+    """
+    A trip-level cost that belongs to no single day (flights, accommodation, passes)
+    """
+    category: str = Field(description="e.g. flights, accommodation, transport pass, visa")
+    amount: float = Field(description="Total for the trip, per person, in the plan's currency")
+    note: str = ""
+
+
+class PlanOverview(BaseModel):
+    """
+    Every part of a travel plan except the day-by-day schedule
+    """
+    currency: str = Field("EUR", description="Currency of every amount in the plan (ISO code)")
+    summary: str = Field(description="Trip overview in a few sentences")
+    highlights: list[str] = Field(default_factory=list)
+    accommodations: list[Accommodation] = Field(default_factory=list, description="3-4 options")
+    costs: list[CostItem] = Field(default_factory=list)
+    bookings: list[Booking] = Field(default_factory=list)
+    packing_list: list[str] = Field(default_factory=list)
+    emergency_info: list[str] = Field(default_factory=list, description="Phone numbers, hospitals, embassy")
+
+
+class DayPlans(BaseModel):
+    """
+    Some days of a trip, planned on their own
+    """
+    currency: str = Field("EUR", description="Currency of every amount in these days (ISO code)")
+    days: list[DayPlan] = Field(default_factory=list)
+
+
+class TravelPlan(PlanOverview):
+    """
+    A complete travel plan: the overview plus one DayPlan per day
+    """
+    days: list[DayPlan] = Field(default_factory=list)
+
+    @property
+    def daily_total(self):
+        return sum(day.budget for day in self.days)
+
+    @property
+    def total_cost(self):
+        return self.daily_total + sum(cost.amount for cost in self.costs)
+
+    def budget_by_category(self):
+        """
+        Total cost per category: trip-level costs plus activities grouped by their category
+        """
+        totals = {}
+        for cost in self.costs:
+            totals[cost.category] = totals.get(cost.category, 0.0) + cost.amount
+        for day in self.days:
+            for activity in day.activities:
+                totals[activity.category] = totals.get(activity.category, 0.0) + activity.cost
+        return totals
+
+
+def parse_model(model, text):
+    """
+    Read a model from an answer holding its JSON, possibly inside a code
+    fence or surrounded by prose. Returns None if it isn't one.
+    """
+    text = text or ""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return model.model_validate_json(text[start:end + 1])
+    except ValidationError:
+        return None
+
+
+def stitch_plan(overview, day_plans):
+    """
+    Build a TravelPlan from an overview and DayPlans of separate chunks
+    """
+    days = sorted((day for plans in day_plans for day in plans.days), key=lambda day: day.day)
+    return TravelPlan(**overview.model_dump(), days=days)
+
+
+def merge_days(plan, added, offset=0):
+    """
+    Add the days of added (DayPlans) to plan, renumbering its existing days
+    by offset when days were added at the start of the trip
+    """
+    days = [day.model_copy(update={"day": day.day + offset}) for day in plan.days] + list(added.days)
+    return plan.model_copy(update={"days": sorted(days, key=lambda day: day.day)})
@@ -0,0 +1,158 @@
+import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from TravelCompact import truncate_text
+
+# Token budget of the existing itinerary shown to the planner when it adds days
+ITINERARY_OUTLINE_TOKENS = 600
+
+# "## Day 3: ...", "**Day 3 - ...**", "Day 3 (2025-06-03)" - only heading lines, not prose
+_DAY_HEADING = re.compile(
+    r"^(?P<prefix>\s*(?:#{1,6}\s*)?(?:\*\*\s*)?)Day\s+(?P<number>\d+)(?=\s*(?:[:\-–—(.,]|\*\*|$))",
+    re.IGNORECASE,
+)
+_MARKDOWN_HEADING = re.compile(r"^\s*(#{1,6})\s")
+_BOLD_LINE = re.compile(r"^\s*\*\*([^*]+)\*\*:?\s*$")
+
+
+@dataclass
+class DateExtension:
+    """
+    Days added to a trip whose old dates lie inside the new ones.
+    before and after are the added dates; existing_days is the old trip length.
+    """
+    before: list = field(default_factory=list)
+    after: list = field(default_factory=list)
+    existing_days: int = 0
+
+    @property
+    def offset(self):
+        # How far the existing days move when days are added at the start
+        return len(self.before)
+
+    @property
+    def added(self):
+        """
+        (day number in the new trip, date) of every added day
+        """
+        days = [(i + 1, day) for i, day in enumerate(self.before)]
+        first_after = self.offset + self.existing_days + 1
+        days += [(first_after + i, day) for i, day in enumerate(self.after)]
+        return days
+
+
+def changed_inputs(previous, inputs):
+    """
+    Names of the trip parameters that differ between two runs
+    """
+    return {name for name, value in inputs.items() if previous.get(name) != value}
+
+
+def date_extension(previous, inputs):
+    """
+    Return a DateExtension if the new dates only add days before and/or after
+    the previous ones, otherwise None
+    """
+    old_from, old_to = previous["date_from"], previous["date_to"]
+    new_from, new_to = inputs["date_from"], inputs["date_to"]
+    if (old_from, old_to) == (new_from, new_to) or new_from > old_from or new_to < old_to:
+        return None
+    return DateExtension(
+        before=[new_from + timedelta(days=i) for i in range((old_from - new_from).days)],
+        after=[old_to + timedelta(days=i + 1) for i in range((new_to - old_to).days)],
+        existing_days=(old_to - old_from).days + 1,
+    )
+
+
+def heading_level(line):
+    """
+    Level of a heading line (1-6 for markdown, 1 for an all-caps bold line,
+    7 for other bold lines) or None for body text
+    """
+    match = _MARKDOWN_HEADING.match(line)
+    if match:
+        return len(match.group(1))
+    match = _BOLD_LINE.match(line)
+    if match:
+        return 1 if match.group(1).isupper() else 7
+    return None
+
+
+def split_itinerary(text):
+    """
+    Split a plan into (head, days, tail): the text before the first day, a
+    list of (day number, day text) and the text after the last day.
+    Returns None if the plan has no day headings.
+    """
+    lines = (text or "").splitlines()
+    starts = [i for i, line in enumerate(lines) if _DAY_HEADING.match(line)]
+    if not starts:
+        return None
+
+    # The day section ends at the first non-day heading at the days' level or above
+    day_level = heading_level(lines[starts[0]]) or 7
+    end = len(lines)
+    for i in range(starts[-1] + 1, len(lines)):
+        level = heading_level(lines[i])
+        if level is not None and level <= day_level and not _DAY_HEADING.match(lines[i]):
+            end = i
+            break
+
+    days = []
+    for start, stop in zip(starts, starts[1:] + [end]):
+        number = int(_DAY_HEADING.match(lines[start]).group("number"))
+        days.append((number, "\n".join(lines[start:stop]).strip()))
+    return "\n".join(lines[:starts[0]]).strip(), days, "\n".join(lines[end:]).strip()
+
+
+def _renumber(block, number):
+    heading, _, body = block.partition("\n")
+    heading = _DAY_HEADING.sub(lambda match: f"{match.group('prefix')}Day {number}", heading, count=1)
+    return f"{heading}\n{body}" if body else heading
+
+
+def merge_itinerary(itinerary, added_text, offset=0):
+    """
+    Merge the day sections of added_text into itinerary. Existing days are
+    renumbered by offset (days added at the start of the trip) and every day
+    is put in order; the rest of the itinerary is kept as is.
+    """
+    existing = split_itinerary(itinerary)
+    if existing is None:
+        return f"{itinerary.rstrip()}\n\n{added_text.strip()}"
+    head, days, tail = existing
+
+    days = [(number + offset, _renumber(block, number + offset)) for number, block in days]
+    added = split_itinerary(added_text)
+    if added is None:
+        # No day headings in the answer: keep it whole after the last day
+        days.append((days[-1][0] + 1, added_text.strip()))
+    else:
+        days += added[1]
+
+    parts = [head] + [block for _, block in sorted(days, key=lambda day: day[0])] + [tail]
+    return "\n\n".join(part for part in parts if part)
+
+
+def itinerary_outline(itinerary, token_budget=ITINERARY_OUTLINE_TOKENS):
+    """
+    Short version of a plan's day sections, so the planner can avoid
+    repeating what is already scheduled
+    """
+    parts = split_itinerary(itinerary)
+    if parts is None:
+        return truncate_text(itinerary or "", token_budget)
+    days = parts[1]
+    per_day = max(20, token_budget // len(days))
+    return "\n".join(f"- {truncate_text(block, per_day)}" for _, block in days)
+
+
+def day_heading_example(itinerary):
+    """
+    First day heading of a plan, used to ask for added days in the same style
+    """
+    parts = split_itinerary(itinerary)
+    if parts is None:
+        return "## Day 1 - <date>"
+    return parts[1][0][1].partition("\n")[0].strip()
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class ModelTier:
+    """
+    A model the agents can be routed to. Costs are USD per million tokens;
+    a call whose provider took longer than latency_budget seconds (0 for no
+    budget) sends the tier's stages to the fallback tier for a while.
+    """
+    name: str
+    model: str
+    prompt_cost: float
+    completion_cost: float
+    latency_budget: float = 0.0
+    fallback: str = None
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return (prompt_tokens * self.prompt_cost + completion_tokens * self.completion_cost) / 1_000_000
+
+
+def _tier(name, model, prompt_cost, completion_cost, latency_budget, fallback=None):
+    # The model and latency budget of each tier can be overridden, e.g. TRAVEL_MODEL_LARGE, TRAVEL_LATENCY_BUDGET_LARGE
+    return ModelTier(
+        name,
+        os.environ.get(f"TRAVEL_MODEL_{name.upper()}", model),
+        prompt_cost,
+        completion_cost,
+        float(os.environ.get(f"TRAVEL_LATENCY_BUDGET_{name.upper()}", str(latency_budget))),
+        fallback,
+    )
+
+
+# Model tiers from fastest to largest, each falling back to the next faster one (Mistral list prices)
+MODEL_TIERS = {
+    "fast": _tier("fast", "mistral/ministral-8b-latest", 0.1, 0.1, 30),
+    "standard": _tier("standard", "mistral/mistral-small-latest", 0.1, 0.3, 60, fallback="fast"),
+    "large": _tier("large", "mistral/mistral-medium-latest", 0.4, 2.0, 120, fallback="standard"),
+}
+
+# Tier used by stages without a route
+DEFAULT_TIER = "standard"
+
+
+def parse_routes(value):
+    """
+    Parse "stage=tier,stage=tier" into {stage: tier}
+    """
+    routes = {}
+    for item in value.split(","):
+        if item.strip():
+            stage, _, tier = item.partition("=")
+            routes[stage.strip()] = tier.strip()
+    return routes
+
+
+# Tier of each stage's agent: the research agents mostly call tools and extract facts, the planner writes the plan.
+# Set TRAVEL_MODEL_ROUTING=0 to run every agent on the standard tier without fallbacks.
+MODEL_ROUTES = parse_routes(os.environ.get("TRAVEL_MODEL_ROUTES", "location=fast,guide=fast,planner=large"))
+MODEL_ROUTING = os.environ.get("TRAVEL_MODEL_ROUTING", "1") != "0"
+
+# Seconds a tier stays on its fallback after a call over its latency budget
+FALLBACK_COOLDOWN = float(os.environ.get("TRAVEL_MODEL_FALLBACK_COOLDOWN", "300"))
+
+
+class ModelRouter:
+    """
+    Picks the model tier of every LLM call. Each stage goes to its routed
+    tier unless that tier recently answered slower than its latency budget,
+    in which case it goes down the fallback chain to the first faster tier
+    that is within budget. Shared by every plan in the process, since a slow
+    model is slow for all of them. Fallback only affects later calls: the
+    slow call itself is not cut short or sent to another tier.
+    """
+
+    def __init__(self, tiers=None, routes=None, cooldown=FALLBACK_COOLDOWN):
+        self.tiers = tiers or MODEL_TIERS
+        self.routes = MODEL_ROUTES if routes is None else routes
+        self.cooldown = cooldown
+        self._slow_until = {}
+        self._lock = threading.Lock()
+        unknown = {tier for tier in self.routes.values() if tier not in self.tiers}
+        if unknown:
+            raise ValueError(f"Unknown model tiers in routes: {', '.join(sorted(unknown))}")
+
+    def tier(self, stage):
+        """
+        Routed tier of a stage, ignoring fallbacks
+        """
+        return self.tiers[self.routes.get(stage, DEFAULT_TIER)]
+
+    def choose(self, stage):
+        """
+        Tier for the next call of a stage. Returns (tier, name of the routed
+        tier if the call falls back from it, else None).
+        """
+        routed = tier = self.tier(stage)
+        now = time.monotonic()
+        with self._lock:
+            while tier.fallback and self._slow_until.get(tier.name, 0) > now:
+                tier = self.tiers[tier.fallback]
+        return tier, routed.name if tier is not routed else None
+
+    def record(self, tier, seconds):
+        """
+        Record the latency of a call. A call over its tier's budget sends the
+        tier's stages to the fallback for cooldown seconds; returns True then.
+        """
+        if not tier.latency_budget or seconds <= tier.latency_budget:
+            return False
+        with self._lock:
+            self._slow_until[tier.name] = time.monotonic() + self.cooldown
+        return True
+
+
+model_router = ModelRouter()
+
+
+def routing_summary(spans):
+    """
+    Aggregate the routed LLM calls of a run's trace spans per stage and tier:
+    calls, fallbacks, calls over budget, time, tokens and estimated cost
+    """
+    rows = {}
+    for span in spans:
+        args = span["args"]
+        if span["name"] != "llm_call" or "tier" not in args:
+            continue
+        row = rows.setdefault((args["stage"], args["tier"]), {
+            "stage": args["stage"], "tier": args["tier"], "model": args["model"], "calls": 0, "fallbacks": 0,
+            "over_budget": 0, "total_s": 0.0, "max_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cost_usd": 0.0,
+        })
+        row["calls"] += 1
+        row["fallbacks"] += 1 if args.get("fallback_from") else 0
+        row["over_budget"] += 1 if args.get("over_budget") else 0
+        row["total_s"] += span["duration"]
+        row["max_s"] = max(row["max_s"], span["duration"])
+        row["prompt_tokens"] += args.get("prompt_tokens", 0)
+        row["completion_tokens"] += args.get("completion_tokens", 0)
+        row["cost_usd"] += args.get("cost_usd", 0.0)
+    for row in rows.values():
+        row["total_s"] = round(row["total_s"], 3)
+        row["max_s"] = round(row["max_s"], 3)
+        row["cost_usd"] = round(row["cost_usd"], 6)
+    return sorted(rows.values(), key=lambda row: (row["stage"], row["tier"]))
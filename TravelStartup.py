@@ -0,0 +1,77 @@
+"""
+Startup profiler.
+
+Imports the app's dependencies and modules one by one in a fresh interpreter
+and reports how long each takes, followed by the cost of building the LLM
+client and the agents.
+
+    python TravelStartup.py
+"""
+import importlib
+import sys
+import time
+
+# In dependency order, so each row only counts what that module adds
+STARTUP_MODULES = [
+    "dotenv",
+    "httpx",
+    "pydantic",
+    "litellm",
+    "crewai",
+    "ddgs",
+    "TravelCache",
+    "TravelLimits",
+    "TravelTrace",
+    "TravelRouting",
+    "TravelCompact",
+    "TravelModels",
+    "TravelExport",
+    "TravelTools",
+    "TravelTasks",
+    "TravelAgents",
+    "TravelDigest",
+    "TravelReplan",
+    "TravelChunks",
+    "TravelKnowledge",
+    "TravelCrew",
+]
+
+
+def profile_imports(modules=STARTUP_MODULES):
+    """
+    Import modules in order and time each, then time the agents' construction.
+    Returns rows of {"step", "seconds", "already_loaded"}.
+    """
+    rows = []
+    for name in modules:
+        already_loaded = name in sys.modules
+        started = time.perf_counter()
+        importlib.import_module(name)
+        rows.append({"step": f"import {name}", "seconds": round(time.perf_counter() - started, 3),
+                     "already_loaded": already_loaded})
+
+    TravelAgents = sys.modules["TravelAgents"]
+    started = time.perf_counter()
+    llm = TravelAgents.TravelLLM(model=TravelAgents.llm.model, temperature=0.2)
+    rows.append({"step": "init TravelLLM", "seconds": round(time.perf_counter() - started, 3),
+                 "already_loaded": False})
+    started = time.perf_counter()
+    TravelAgents.create_agents(llm)
+    rows.append({"step": "init create_agents", "seconds": round(time.perf_counter() - started, 3),
+                 "already_loaded": False})
+    return rows
+
+
+def main():
+    started = time.perf_counter()
+    rows = profile_imports()
+    total = time.perf_counter() - started
+    width = max(len(row["step"]) for row in rows)
+    for row in rows:
+        note = "  (already loaded)" if row["already_loaded"] else ""
+        print(f"{row['step']:<{width}}  {row['seconds']:>7.3f}s{note}")
+    print(f"{'total':<{width}}  {total:>7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,62 @@
 from crewai import Task
 from datetime import datetime
+from pydantic import BaseModel, Field
+import json
 
-def location_task(agent, from_city, destination_city, date_from, date_to):
+from TravelModels import DayPlans, PlanOverview, TravelPlan
+
+# Fields of one day in a structured answer (DayPlan)
+_DAY_FIELDS = """day (the day number), date (YYYY-MM-DD), title (theme of the day), activities in time
+        order - sights, breakfast, lunch and dinner at specific restaurants, transfers - each with time, title,
+        location, a short description, category (activity, meal, transport or accommodation), estimated cost per
+        person and booking_required, and transport_notes on getting between the day's places"""
+
+class PlanTask(Task):
+    """
+    Planner task whose answer, if answer_model is set, is the JSON of that
+    model. The pipeline parses it (see TravelModels.parse_model) instead of
+    crewai, so an answer that isn't valid JSON is kept as raw text rather
+    than failing the crew.
+    """
+    answer_model: type[BaseModel] | None = Field(default=None, description="Model the answer is the JSON of")
+
+
+def _json_format(model):
+    """
+    Instructions to answer with only the JSON of model
+    """
+    return f"""
+        
+        Your final answer must be only a JSON object following this JSON schema, without code block markers
+        or any other text:
+        {json.dumps(model.model_json_schema())}"""
+
+def _prefetched_section(knowledge, missing):
+    """
+    Instructions and text for research that was searched ahead of time
+    """
+    if missing:
+        search_note = f"Search only for the topics not covered below: {', '.join(missing)}."
+    else:
+        search_note = "Every topic is covered below: write the report from it without searching again."
+    return f"""
+        
+        PRE-FETCHED RESEARCH: recent search results for this destination are below. {search_note}
+        {knowledge}"""
+
+def location_task(agent, from_city, destination_city, date_from, date_to, knowledge=None, missing=()):
     """
-    Task for Location Expert to research destination information
+    Task for Location Expert to research destination information.
+    knowledge is pre-fetched research; missing lists the topics it lacks.
     """
+    prefetched = _prefetched_section(knowledge, missing) if knowledge else ""
+
     return Task(
         description=f"""Research comprehensive travel information for a trip from {from_city} to {destination_city}
         between {date_from} and {date_to}.
         
-        Use the search_web_tool to find current information about:
+        Use the search_web_batch_tool to search all of these topics in a single step, then
+        search_web_tool for any follow-up searches. Find current information about:
         
         1. **Visa Requirements**: Check if travelers from {from_city} need a visa for {destination_city}
         2. **Flight Options**: Research available flights, approximate costs, and travel time
@@ -18,8 +65,8 @@ def location_task(agent, from_city, destination_city, date_from, date_to):
         5. **Safety Information**: Research current safety advisories and travel warnings
         6. **Currency & Budget**: Research local currency, exchange rates, and general cost of living
         
-        IMPORTANT: You MUST use the search_web_tool for each of these topics to get current, accurate information.
-        Do not rely on general knowledge alone - search for specific, up-to-date information.""",
+        IMPORTANT: You MUST search for each of these topics to get current, accurate information.
+        Do not rely on general knowledge alone - search for specific, up-to-date information.{prefetched}""",
         expected_output="""A comprehensive report including:
         - Visa requirements and application process (if needed)
         - Flight options with estimated costs
@@ -31,17 +78,21 @@ def location_task(agent, from_city, destination_city, date_from, date_to):
         agent=agent,
     )
 
-def guide_task(agent, destination_city, interests, date_from, date_to):
+def guide_task(agent, destination_city, interests, date_from, date_to, knowledge=None, missing=()):
     """
-    Task for Local Guide Expert to provide recommendations
+    Task for Local Guide Expert to provide recommendations.
+    knowledge is pre-fetched research; missing lists the topics it lacks.
     """
+    prefetched = _prefetched_section(knowledge, missing) if knowledge else ""
+
     return Task(
         description=f"""Act as a local guide for {destination_city} and create personalized recommendations
         for a traveler interested in: {interests}.
         
         Trip dates: {date_from} to {date_to}
         
-        Use the search_web_tool to research and provide:
+        Use the search_web_batch_tool to research all of these topics in a single step, then
+        search_web_tool for any follow-up searches, and provide:
         
         1. **Top Attractions**: Must-see landmarks and attractions matching the interests
         2. **Local Restaurants**: Highly-rated local eateries (not tourist traps) serving authentic cuisine
@@ -52,7 +103,7 @@ def guide_task(agent, destination_city, interests, date_from, date_to):
         7. **Shopping Areas**: Local markets, boutiques, or shopping districts
         
         IMPORTANT: Search for current information including recent reviews, opening hours, and any special events
-        or closures during the travel period.""",
+        or closures during the travel period.{prefetched}""",
         expected_output="""A detailed local guide including:
         - Top 10-15 attractions with descriptions and why they match the interests
         - 8-10 restaurant recommendations with specific dishes to try
@@ -64,21 +115,35 @@ def guide_task(agent, destination_city, interests, date_from, date_to):
         agent=agent,
     )
 
-def planner_task(context_tasks, agent, destination_city, interests, date_from, date_to):
+def planner_task(context_tasks, agent, destination_city, interests, date_from, date_to, research_digest=None,
+                 structured=False):
     """
-    Task for Travel Planner Expert to create the final itinerary
+    Task for Travel Planner Expert to create the final itinerary.
+    If research_digest is given it replaces the full research reports as context.
+    If structured, the answer is a TravelPlan (all amounts in one currency).
     """
     # Calculate trip duration
     trip_duration = (date_to - date_from).days + 1
+
+    if research_digest:
+        research_source = "the research digest below"
+        digest_section = f"""
+        
+        RESEARCH DIGEST (from the Location Expert and Local Guide Expert):
+        {research_digest}"""
+    else:
+        research_source = "context"
+        digest_section = ""
     
-    return Task(
+    return PlanTask(
         description=f"""Create a comprehensive, day-by-day travel itinerary for {destination_city}
         from {date_from} to {date_to} ({trip_duration} days).
         
         Traveler interests: {interests}
         
-        Use information from the Location Expert and Local Guide Expert (provided in context),
-        and use the search_web_tool to verify current information about:
+        Use information from the Location Expert and Local Guide Expert (provided in {research_source}),
+        and use the search_web_batch_tool (one step for all topics) or search_web_tool to verify
+        current information about:
         
         1. **Accommodation**: Research 3-4 hotel/accommodation options with prices
         2. **Daily Itinerary**: Create hour-by-hour plans for each day
@@ -95,8 +160,19 @@ def planner_task(context_tasks, agent, destination_city, interests, date_from, d
         - Consider opening hours and peak times
         - Stay within a reasonable budget
         
-        IMPORTANT: Search for current prices, opening hours, and booking requirements.""",
-        expected_output=f"""A complete travel plan document including:
+        IMPORTANT: Search for current prices, opening hours, and booking requirements.{digest_section}""",
+        expected_output=f"""A TravelPlan with every amount in the local currency of {destination_city}:
+        - currency: its ISO code
+        - summary: trip overview, with the key booking priorities; highlights: the trip's highlights
+        - accommodations: 3-4 options with name, area, price_per_night, pros and cons
+        - costs: trip-level costs per person that belong to no single day (flights, accommodation for all
+          nights, transport passes, visa), each with category, amount and note
+        - bookings: activities, restaurants and tickets to book ahead, with kind, link or contact, and when
+        - packing_list: based on weather and planned activities
+        - emergency_info: phone numbers, hospital/clinic locations, embassy contacts
+        - days: one entry for each of the {trip_duration} days, with {_DAY_FIELDS}""" + _json_format(TravelPlan) \
+        if structured else f"""\
+A complete travel plan document including:
         
         **EXECUTIVE SUMMARY**
         - Trip overview and highlights
@@ -131,5 +207,116 @@ def planner_task(context_tasks, agent, destination_city, interests, date_from, d
         
         The plan should be detailed, practical, and ready to execute.""",
         agent=agent,
-        context=context_tasks,
-    )
\ No newline at end of file
+        context=[] if research_digest else context_tasks,
+        answer_model=TravelPlan if structured else None,
+    )
+
+def planner_overview_task(agent, destination_city, interests, date_from, date_to, research_digest,
+                          structured=False):
+    """
+    Task for Travel Planner Expert to write every part of the travel plan
+    except the day-by-day itinerary, which is planned in chunks.
+    If structured, the answer is a PlanOverview.
+    """
+    trip_duration = (date_to - date_from).days + 1
+
+    return PlanTask(
+        description=f"""Write the overview of a {trip_duration}-day trip to {destination_city}
+        from {date_from} to {date_to}. The day-by-day itinerary is planned separately: do NOT write it.
+        
+        Traveler interests: {interests}
+        
+        Use the research digest below, and use the search_web_batch_tool (one step for all topics) or
+        search_web_tool to verify current accommodation prices and booking requirements.
+        
+        RESEARCH DIGEST (from the Location Expert and Local Guide Expert):
+        {research_digest}""",
+        expected_output=f"""A PlanOverview (no days) with every amount in the local currency of {destination_city}:
+        - currency: its ISO code
+        - summary: trip overview, with the key booking priorities; highlights: the trip's highlights
+        - accommodations: 3-4 options with name, area, price_per_night, pros and cons
+        - costs: trip-level costs per person for all {trip_duration} days that belong to no single day (flights,
+          accommodation for all nights, transport passes, visa), each with category, amount and note
+        - bookings: activities, restaurants and tickets to book ahead, with kind, link or contact, and when
+        - packing_list: based on weather and planned activities
+        - emergency_info: phone numbers, hospital/clinic locations, embassy contacts""" + _json_format(PlanOverview) \
+        if structured else f"""\
+The following sections, with these exact headings:
+        
+        **EXECUTIVE SUMMARY**
+        - Trip overview and highlights
+        - Total estimated budget breakdown for all {trip_duration} days
+        - Key booking priorities
+        
+        **ACCOMMODATION OPTIONS**
+        - 3-4 recommended hotels/accommodations with prices, locations, and pros/cons
+        
+        **BOOKING CHECKLIST**
+        - Activities requiring advance booking with links/contacts
+        - Restaurant reservations needed
+        - Transportation tickets to purchase
+        
+        **PACKING LIST**
+        - Based on weather and planned activities
+        
+        **EMERGENCY INFORMATION**
+        - Important phone numbers
+        - Hospital/clinic locations
+        - Embassy contact information""",
+        agent=agent,
+        answer_model=PlanOverview if structured else None,
+    )
+
+def planner_days_task(agent, destination_city, interests, date_from, date_to, days, research_digest,
+                      heading_example="## Day 1 - <date>", itinerary_outline=None, focus=None, structured=False):
+    """
+    Task for Travel Planner Expert to plan only some days of the trip: the
+    days added to an existing itinerary, or one chunk of a long trip.
+    days is a list of (day number, date). itinerary_outline summarises days
+    that already exist; focus lists the attractions to build these days around.
+    If structured, the answer is DayPlans.
+    """
+    trip_duration = (date_to - date_from).days + 1
+    day_list = "\n        ".join(f"- Day {number}: {day}" for number, day in days)
+
+    if itinerary_outline:
+        other_days = f"""Do not rewrite the existing days, and avoid repeating attractions and restaurants
+        they already include.
+        
+        EXISTING ITINERARY (outline):
+        {itinerary_outline}"""
+    else:
+        other_days = "The other days are planned separately, so cover only the days listed."
+    if focus:
+        other_days += f"""
+        
+        Build these days around these attractions (the other days cover the rest of the research):
+        {focus}"""
+
+    return PlanTask(
+        description=f"""Plan ONLY the following days ({len(days)} days) of a {trip_duration}-day trip to
+        {destination_city} from {date_from} to {date_to}:
+        {day_list}
+        
+        Traveler interests: {interests}
+        
+        Use the research digest below, and use search_web_tool only to verify opening hours, prices or events
+        on these dates. {other_days}
+        
+        RESEARCH DIGEST (from the Location Expert and Local Guide Expert):
+        {research_digest}""",
+        expected_output=f"""DayPlans with currency (the ISO code of the local currency of {destination_city}, used for
+        every amount) and days: only the {len(days)} day(s) listed, in order, each with
+        {_DAY_FIELDS}.""" + _json_format(DayPlans) \
+        if structured else f"""Only the {len(days)} day(s) listed, in order. Start each day with a heading in the
+        style "{heading_example}", using the day numbers listed above. For each day:
+        - Morning activities (with times and locations)
+        - Lunch recommendation
+        - Afternoon activities (with times and locations)
+        - Dinner recommendation
+        - Evening activities (optional)
+        - Daily budget estimate
+        - Transportation notes""",
+        agent=agent,
+        answer_model=DayPlans if structured else None,
+    )
@@ -1,22 +1,205 @@
 from crewai.tools import tool
 from ddgs import DDGS
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import threading
+import time
+from TravelCache import SearchCache, SearchRegistry
+from TravelLimits import call_with_retry
+from TravelCompact import compact_results
+from TravelTrace import count_tokens, span, submit
 
-@tool
-def search_web_tool(query: str):
+# Shared on-disk cache for search results (set TRAVEL_SEARCH_CACHE=0 to disable)
+SEARCH_CACHE_ENABLED = os.environ.get("TRAVEL_SEARCH_CACHE", "1") != "0"
+search_cache = SearchCache(
+    max_entries=int(os.environ.get("TRAVEL_SEARCH_CACHE_MAX_ENTRIES", "5000")),
+) if SEARCH_CACHE_ENABLED else None
+
+# Limits for batched searches
+SEARCH_BATCH_WORKERS = int(os.environ.get("TRAVEL_SEARCH_BATCH_WORKERS", "4"))
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("TRAVEL_SEARCH_BATCH_MAX_QUERIES", "10"))
+SEARCH_QUERY_TIMEOUT = float(os.environ.get("TRAVEL_SEARCH_QUERY_TIMEOUT", "20"))
+
+SEARCH_TIMEOUT = int(os.environ.get("TRAVEL_SEARCH_TIMEOUT", "10"))
+
+# Searches within one plan that closely match an earlier one reuse its results (TRAVEL_SEARCH_DEDUP=0 to disable)
+SEARCH_DEDUP_ENABLED = os.environ.get("TRAVEL_SEARCH_DEDUP", "1") != "0"
+SEARCH_DEDUP_THRESHOLD = float(os.environ.get("TRAVEL_SEARCH_DEDUP_THRESHOLD", "0.8"))
+
+# Registry of the current plan's searches, set by search_registry()
+current_registry = contextvars.ContextVar("travel_search_registry", default=None)
+
+# One DDGS client per thread, reused across searches so connections are pooled
+_ddgs_local = threading.local()
+
+# Long-lived pool for batched searches, so its threads and their DDGS clients outlive each batch
+_search_pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_BATCH_WORKERS), thread_name_prefix="search")
+
+
+def _ddgs_client():
+    client = getattr(_ddgs_local, "client", None)
+    if client is None:
+        client = _ddgs_local.client = DDGS(timeout=SEARCH_TIMEOUT)
+    return client
+
+
+def live_search(query, max_results=10):
     """
-    Searches the web and returns results.
-    Accepts a string query. If a dictionary is passed, it will try to extract a string safely.
+    Runs a live DuckDuckGo text search and returns the list of result dicts.
+    Rate limited, and retried with backoff when DuckDuckGo throttles us.
     """
+    return call_with_retry("search", lambda: [r for r in _ddgs_client().text(query, max_results=max_results)])
+
+
+def _coerce_query(query):
     # Defensive check: if query is a dict, extract the string
     if isinstance(query, dict):
         # Try common keys
         query = query.get("description") or query.get("query") or str(query)
-    
+
     # Make sure we now have a string
     if not isinstance(query, str):
         raise ValueError(f"Query must be a string, got {type(query)}: {query}")
+    return query
+
+
+@contextmanager
+def search_registry(threshold=SEARCH_DEDUP_THRESHOLD):
+    """
+    Deduplicate the searches made inside the block, including those of
+    worker threads started with TravelTrace.submit. Yields the registry,
+    whose searches and avoided counters report what it saved, or None if
+    deduplication is disabled.
+    """
+    registry = SearchRegistry(threshold) if SEARCH_DEDUP_ENABLED else None
+    token = current_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        current_registry.reset(token)
+
+
+def _cached_search(query, info):
+    # Perform the search, reusing cached results when available
+    if search_cache is None:
+        info["cache"] = "off"
+        return live_search(query)
+
+    info["cache"] = "hit"
+
+    def fetch(query):
+        info["cache"] = "miss"
+        return live_search(query)
+
+    return search_cache.get_or_search(query, fetch)
+
+
+def _search(query):
+    with span("search_web_tool", "tool", query=query) as info:
+        registry = current_registry.get()
+        if registry is None:
+            return _cached_search(query, info)
+        results, matched = registry.search(query, lambda query: _cached_search(query, info))
+        if matched is not None:
+            info["dedup"] = matched
+        return results
+
+
+def search_compact(query):
+    """
+    Searches and returns a compact, ranked text block of the results, with a
+    footer reporting how many tokens the compaction saved
+    """
+    results = _search(query)
+    with span("compact_results", "tool", query=query) as info:
+        text, kept = compact_results(query, results)
+        raw_tokens = count_tokens(str(results))
+        compact_tokens = count_tokens(text)
+        info.update(raw_tokens=raw_tokens, compact_tokens=compact_tokens,
+                    saved_tokens=max(0, raw_tokens - compact_tokens))
+    return (f"{text}\n(kept {len(kept)} of {len(results)} results, ~{compact_tokens} tokens, "
+            f"saved ~{max(0, raw_tokens - compact_tokens)} tokens)")
+
+
+def search_many(queries, timeout=SEARCH_QUERY_TIMEOUT, search=_search):
+    """
+    Runs several searches on the shared search pool and returns a dict mapping
+    each query to {"results": ...} or {"error": "..."}. A failed or slow
+    query never discards the results of the others. Each query gets timeout
+    seconds from when it starts running, so queries queued behind other
+    batches on the shared pool aren't timed out before they start.
+    """
+    # Drop duplicates but keep the caller's order
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        return {}
+
+    started = {query: threading.Event() for query in queries}
+    start_times = {}
+
+    def run(query):
+        start_times[query] = time.monotonic()
+        started[query].set()
+        return search(query)
+
+    futures = [(query, submit(_search_pool, run, query)) for query in queries]
+
+    response = {}
+    try:
+        for query, future in futures:
+            # Wait for the query to leave the pool's queue, then give it its timeout
+            while not started[query].wait(0.05) and not future.done():
+                pass
+            deadline = start_times.get(query, time.monotonic()) + timeout
+            try:
+                response[query] = {"results": future.result(timeout=max(0.0, deadline - time.monotonic()))}
+            except FutureTimeoutError:
+                response[query] = {"error": f"timed out after {timeout:g}s"}
+            except Exception as e:
+                response[query] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        # Drop this batch's searches that haven't started; the pool itself stays up
+        for _, future in futures:
+            future.cancel()
+    return response
+
+
+@tool
+def search_web_tool(query: str):
+    """
+    Searches the web and returns results.
+    Accepts a string query. If a dictionary is passed, it will try to extract a string safely.
+    """
+    query = _coerce_query(query)
+    return search_compact(query)
+
+
+@tool
+def search_web_batch_tool(queries: list[str]):
+    """
+    Searches the web for several queries at once and returns the results of each.
+    Accepts a list of query strings (up to 10). Use it to research every topic
+    in a single step. The response is a JSON object mapping each query to its
+    "results" text, or to an "error" if that search failed, timed out or was
+    over the batch limit (search those with search_web_tool).
+    """
+    # Agents sometimes pass the list as a JSON string or one query per line
+    if isinstance(queries, str):
+        try:
+            queries = json.loads(queries)
+        except ValueError:
+            queries = [line for line in queries.splitlines() if line.strip()]
+    if isinstance(queries, (str, dict)):
+        queries = [queries]
+    if not isinstance(queries, list):
+        raise ValueError(f"Queries must be a list of strings, got {type(queries)}: {queries}")
 
-    # Perform the search
-    with DDGS() as ddgs:
-        results = [r for r in ddgs.text(query, max_results=10)]
-    return str(results)
\ No newline at end of file
+    queries = list(dict.fromkeys(_coerce_query(query) for query in queries))
+    response = search_many(queries[:SEARCH_BATCH_MAX_QUERIES], search=search_compact)
+    # Tell the agent which queries were left out so it can search them separately
+    for query in queries[SEARCH_BATCH_MAX_QUERIES:]:
+        response[query] = {"error": f"not run: batch limit is {SEARCH_BATCH_MAX_QUERIES} queries"}
+    return json.dumps(response, ensure_ascii=False)
@@ -0,0 +1,155 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where run traces are written (set TRAVEL_TRACE=0 to keep them in memory only)
+TRACE_DIR = os.environ.get("TRAVEL_TRACE_DIR", "traces")
+TRACE_ENABLED = os.environ.get("TRAVEL_TRACE", "1") != "0"
+
+# Tracer of the run the current code belongs to
+current_tracer = contextvars.ContextVar("travel_tracer", default=None)
+
+
+def count_tokens(text, model="mistral/mistral-small-latest"):
+    """
+    Count the tokens of a string, falling back to an estimate if litellm's
+    tokenizer is unavailable
+    """
+    if not text:
+        return 0
+    try:
+        import litellm
+
+        return litellm.token_counter(model=model, text=text)
+    except Exception:
+        return max(1, len(re.findall(r"\w+|[^\w\s]", text)) * 4 // 3)
+
+
+class Tracer:
+    """
+    Collects timed spans for one plan run and exports them as a Chrome trace
+    (open it in chrome://tracing or https://ui.perfetto.dev)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.created = datetime.now()
+        self.spans = []
+        self._start = time.perf_counter()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, category, started, finished, args):
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self.spans.append({
+                "name": name,
+                "cat": category,
+                "start": started - self._start,
+                "duration": finished - started,
+                "tid": thread.ident,
+                "args": args,
+            })
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        events = [
+            {"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+            for tid, thread_name in self._threads.items()
+        ]
+        for span in self.spans:
+            events.append({
+                "ph": "X",
+                "name": span["name"],
+                "cat": span["cat"],
+                "ts": round(span["start"] * 1e6),
+                "dur": round(span["duration"] * 1e6),
+                "pid": pid,
+                "tid": span["tid"],
+                "args": span["args"],
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"run": self.name}}
+
+    def save(self, directory=TRACE_DIR):
+        """
+        Write the trace as Chrome trace JSON and return its path
+        """
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^\w-]+", "_", self.name).strip("_")
+        path = os.path.join(directory, f"{self.created:%Y%m%d-%H%M%S}-{slug}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        return path
+
+    def summary(self):
+        """
+        Aggregate spans by category and name into summary rows
+        """
+        rows = {}
+        for span in self.spans:
+            key = (span["cat"], span["name"])
+            row = rows.setdefault(key, {
+                "category": span["cat"], "name": span["name"], "calls": 0, "total_s": 0.0, "max_s": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "saved_tokens": 0, "cache_hits": 0, "cache_misses": 0,
+                "deduped": 0, "cost_usd": 0.0,
+            })
+            row["calls"] += 1
+            row["total_s"] += span["duration"]
+            row["max_s"] = max(row["max_s"], span["duration"])
+            args = span["args"]
+            row["prompt_tokens"] += args.get("prompt_tokens", 0)
+            row["completion_tokens"] += args.get("completion_tokens", 0)
+            row["saved_tokens"] += args.get("saved_tokens", 0)
+            if args.get("cache") == "hit":
+                row["cache_hits"] += 1
+            elif args.get("cache") == "miss":
+                row["cache_misses"] += 1
+            if args.get("dedup"):
+                row["deduped"] += 1
+            row["cost_usd"] += args.get("cost_usd", 0.0)
+        for row in rows.values():
+            row["total_s"] = round(row["total_s"], 3)
+            row["max_s"] = round(row["max_s"], 3)
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        return sorted(rows.values(), key=lambda row: (row["category"], -row["total_s"]))
+
+
+@contextmanager
+def tracing(name):
+    """
+    Make a new Tracer current for the code run inside the block
+    """
+    tracer = Tracer(name)
+    token = current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        current_tracer.reset(token)
+
+
+@contextmanager
+def span(name, category, **args):
+    """
+    Time the block as a span of the current run. Yields the span's args dict,
+    which the block may update (e.g. with token counts or cache status).
+    """
+    tracer = current_tracer.get()
+    started = time.perf_counter()
+    try:
+        yield args
+    finally:
+        if tracer is not None:
+            tracer.record(name, category, started, time.perf_counter(), args)
+
+
+def submit(pool, fn, *args, **kwargs):
+    """
+    Submit fn to an executor so it runs in the current run's trace context
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -1,15 +1,39 @@
 import warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='pydantic')
 
-from TravelAgents import guide_expert, location_expert, planner_expert
-from TravelTasks import location_task, guide_task, planner_task
-from crewai import Crew, Process
 import streamlit as st
 from datetime import datetime
+import json
+import os
+import time
+from functools import partial
+
+from TravelExport import render_csv, render_json, render_report as render_report_text
+from TravelJobs import JobLimitError, JobManager
+
+# Set TRAVEL_STARTUP_PROFILE=1 to see import and init costs of the pipeline
+STARTUP_PROFILE = os.environ.get("TRAVEL_STARTUP_PROFILE", "0") == "1"
 
 # Page Configuration
 st.set_page_config(page_title="🌍 Trip Planner", layout="wide")
 
+
+@st.cache_resource(show_spinner="🧳 Loading the AI agents (first plan only)...")
+def load_pipeline():
+    """
+    Import crewai, the LLM client and the pipeline once per server process.
+    Deferred until the first plan so the page itself loads instantly. The
+    agents are built per plan by plan_job, since concurrent jobs can't share them.
+    """
+    started = time.perf_counter()
+    if STARTUP_PROFILE:
+        from TravelStartup import profile_imports
+        startup_rows = profile_imports()
+    else:
+        startup_rows = []
+    import TravelCrew
+    return TravelCrew, startup_rows, time.perf_counter() - started
+
 # Custom CSS for better styling
 st.markdown("""
 <style>
@@ -78,15 +102,19 @@ with col2:
 
 interests = st.text_area("🎯 Your Interests", "sightseeing and good food", height=80)
 
-# Initialize session state for storing responses
-if "location_response" not in st.session_state:
-    st.session_state.location_response = None
-if "guide_response" not in st.session_state:
-    st.session_state.guide_response = None
-if "planner_response" not in st.session_state:
-    st.session_state.planner_response = None
-if "execution_log" not in st.session_state:
-    st.session_state.execution_log = []
+@st.cache_resource
+def get_job_manager():
+    """
+    One background job manager per server process, shared by all sessions
+    """
+    return JobManager()
+
+
+jobs = get_job_manager()
+
+# The current job id is also kept in the URL so a refresh or reconnect finds it again
+if "job_id" not in st.session_state:
+    st.session_state.job_id = st.query_params.get("job")
 
 # Button to run CrewAI - Centered below inputs
 st.divider()
@@ -97,182 +125,227 @@ st.info("🤖 **Three AI Agents working together** to craft you the best travel
 col_button = st.columns([1, 2, 1])
 with col_button[1]:
     generate_btn = st.button("🚀 Generate Travel Plan", use_container_width=True, key="generate_btn")
+    parallel_research = st.toggle("⚡ Run research agents in parallel", value=True, key="parallel_research")
+    incremental = st.toggle("♻️ Only redo what changed since the last plan", value=True, key="incremental",
+                            help="Keeps the reports whose inputs are unchanged, and only plans the added days "
+                                 "when the trip gets longer")
 st.divider()
 
+# Report sections shown in the result tabs, keyed by pipeline stage
+REPORT_SECTIONS = {
+    "planner": ("planner-section", "### ✈️ Travel Planner Expert Report",
+                "⏳ The Travel Planner Expert starts once the research agents finish..."),
+    "location": ("location-section", "### 🏢 Location Expert Report",
+                 "⏳ The Location Expert is researching your destination..."),
+    "guide": ("guide-section", "### 🎭 Local Guide Expert Report",
+              "⏳ The Local Guide Expert is looking for things to do..."),
+}
+
+
+def plan_job(inputs, on_event, previous=None):
+    """
+    Run one travel plan in a background job, with its own set of agents.
+    previous, the result of this session's last plan, makes it a re-plan.
+    """
+    pipeline, _, _ = load_pipeline()
+    from TravelAgents import create_agents
+    return pipeline.run_travel_plan(**inputs, on_event=on_event, agents=create_agents(), previous=previous)
+
+
+def render_report(stage, text):
+    css_class, title, waiting = REPORT_SECTIONS[stage]
+    if not text:
+        st.info(waiting)
+        return
+    st.markdown(f'<div class="agent-section {css_class}">', unsafe_allow_html=True)
+    st.markdown(title)
+    st.markdown(text)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def render_status(job):
+    if job.status == "failed":
+        label, state = "❌ Travel plan generation failed", "error"
+    elif job.done:
+        label, state = f"🎉 Travel plan generation complete! ({job.elapsed:.0f}s)", "complete"
+    elif job.status == "queued":
+        label, state = f"⏳ Waiting for a free planner ({jobs.position(job)} plans ahead)...", "running"
+    else:
+        label, state = f"🔄 Generating your travel plan... ({job.elapsed:.0f}s)", "running"
+    
+    with st.status(label, state=state, expanded=not job.done):
+        st.write("📋 Setting up travel planning workflow...")
+        if job.status != "queued":
+            st.write(f"🤖 Starting AI agents workflow ({job.inputs['mode']} research)...")
+        for event in list(job.events):
+            st.write(event.message)
+        if job.status == "done":
+            st.write("✅ All agents completed successfully!")
+
+
+def render_debug(job):
+    pipeline, startup_rows, load_seconds = load_pipeline()
+    result = job.result
+    with st.expander("⏱️ Stage Timings"):
+        st.markdown(pipeline.format_timing_report(result))
+    
+    summary = pipeline.trace_summary(result)
+    if summary:
+        with st.expander("🔍 Debug: Run Trace"):
+            st.table(summary)
+            st.download_button(
+                label="⬇️ Download trace (Chrome trace JSON)",
+                data=json.dumps(result.trace.to_chrome_trace(), default=str),
+                file_name=f"Trace_{job.inputs['destination_city']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json",
+            )
+            st.caption("Open the trace in chrome://tracing or https://ui.perfetto.dev")
+    
+    if result.routing:
+        with st.expander("🧭 Model Routing"):
+            st.table(result.routing)
+    
+    if STARTUP_PROFILE:
+        with st.expander("🚦 Startup Profile"):
+            st.write(f"Pipeline loaded in {load_seconds:.2f}s (once per server process)")
+            st.table(startup_rows)
+
+
+def render_downloads(job):
+    destination_city = job.inputs["destination_city"]
+    plan = job.result.plan
+    stamp = datetime.now().strftime('%Y%m%d')
+    
+    st.markdown("### 📥 Download Your Travel Plan")
+    
+    # Rendered from templates, so downloads don't cost another model call
+    combined_report = render_report_text(job.inputs, job.result.location, job.result.guide, job.result.planner)
+    
+    # Download buttons
+    columns = st.columns(4 if plan is not None else 3)
+    
+    with columns[0]:
+        st.download_button(
+            label="📄 Download as Text",
+            data=combined_report,
+            file_name=f"Travel_Plan_{destination_city}_{stamp}.txt",
+            mime="text/plain",
+            use_container_width=True
+        )
+    
+    with columns[1]:
+        st.download_button(
+            label="📋 Download as Markdown",
+            data=combined_report,
+            file_name=f"Travel_Plan_{destination_city}_{stamp}.md",
+            mime="text/markdown",
+            use_container_width=True
+        )
+    
+    with columns[2]:
+        # One row per activity with a structured plan, else a summary of the trip
+        st.download_button(
+            label="📊 Download Itinerary CSV" if plan is not None else "📊 Download Summary CSV",
+            data=render_csv(job.inputs, plan),
+            file_name=f"Travel_{'Itinerary' if plan is not None else 'Summary'}_{destination_city}_{stamp}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    
+    if plan is not None:
+        with columns[3]:
+            st.download_button(
+                label="🧾 Download as JSON",
+                data=render_json(job.inputs, plan),
+                file_name=f"Travel_Plan_{destination_city}_{stamp}.json",
+                mime="application/json",
+                use_container_width=True
+            )
+    
+    # Success message
+    st.success("✅ All downloads are ready! Choose your preferred format above.")
+
+
+def render_job(job):
+    render_status(job)
+    
+    if job.status == "failed":
+        st.error(f"❌ Error during execution: {job.error}")
+        
+        # Show debug information
+        with st.expander("🔍 Debug Information"):
+            st.code(job.details or job.error)
+            st.write("**Execution Log:**")
+            for event in job.events:
+                st.text(event.message)
+        return
+    
+    # Display Results Hierarchically
+    st.markdown("---")
+    st.subheader("📊 Travel Plan Results")
+    if job.status == "done":
+        render_debug(job)
+    
+    # Each report shows up as soon as its agent finishes
+    tab1, tab2, tab3, tab4 = st.tabs(["📝 Full Itinerary", "📍 Location Info", "🎯 Local Guide", "📥 Downloads"])
+    with tab1:
+        render_report("planner", job.outputs.get("planner"))
+    with tab2:
+        render_report("location", job.outputs.get("location"))
+    with tab3:
+        render_report("guide", job.outputs.get("guide"))
+    with tab4:
+        if job.status == "done":
+            render_downloads(job)
+        else:
+            st.info("⏳ Downloads will be ready once the itinerary is complete.")
+
+
+@st.fragment(run_every=1.0)
+def poll_job(job_id):
+    """
+    Redraw a running job every second; rerun the whole page once it finishes
+    """
+    job = jobs.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    render_job(job)
+
+
 # Run CrewAI
 if generate_btn:
     if not from_city or not destination_city or not date_from or not date_to or not interests:
         st.error("⚠️ Please fill in all fields before generating your travel plan.")
     else:
-        # Reset session state
-        st.session_state.execution_log = []
-        
-        # Create placeholder containers for streaming
-        status_placeholder = st.empty()
-        results_container = st.container()
-        
+        inputs = {
+            "from_city": from_city,
+            "destination_city": destination_city,
+            "date_from": date_from,
+            "date_to": date_to,
+            "interests": interests,
+            "mode": "parallel" if parallel_research else "sequential",
+        }
+        # Re-plan from this session's last finished plan
+        previous = None
+        if incremental and st.session_state.job_id:
+            last_job = jobs.get(st.session_state.job_id)
+            if last_job is not None and last_job.status == "done":
+                previous = last_job.result
         try:
-            with status_placeholder.status("🔄 Generating your travel plan...", expanded=True):
-                # Create all tasks first (don't execute yet)
-                st.write("📋 Setting up travel planning workflow...")
-                
-                loc_task = location_task(location_expert, from_city, destination_city, date_from, date_to)
-                guid_task = guide_task(guide_expert, destination_city, interests, date_from, date_to)
-                plan_task = planner_task([loc_task, guid_task], planner_expert, destination_city, interests, date_from, date_to)
-                
-                # Option 1: Run all agents in a single crew (RECOMMENDED)
-                st.write("🤖 Starting AI agents workflow...")
-                
-                crew = Crew(
-                    agents=[location_expert, guide_expert, planner_expert],
-                    tasks=[loc_task, guid_task, plan_task],
-                    process=Process.sequential,
-                    verbose=True,
-                )
-                
-                st.write("⚙️ Executing travel planning...")
-                result = crew.kickoff()
-                
-                # Extract individual task outputs
-                if hasattr(result, 'tasks_output') and result.tasks_output:
-                    st.write("✅ All agents completed successfully!")
-                    
-                    # Get individual task results
-                    if len(result.tasks_output) >= 3:
-                        st.session_state.location_response = str(result.tasks_output[0].raw if hasattr(result.tasks_output[0], 'raw') else result.tasks_output[0])
-                        st.session_state.guide_response = str(result.tasks_output[1].raw if hasattr(result.tasks_output[1], 'raw') else result.tasks_output[1])
-                        st.session_state.planner_response = str(result.tasks_output[2].raw if hasattr(result.tasks_output[2], 'raw') else result.tasks_output[2])
-                    else:
-                        # Fallback: use final result for all
-                        final_output = result.raw if hasattr(result, 'raw') else str(result)
-                        st.session_state.location_response = final_output
-                        st.session_state.guide_response = final_output
-                        st.session_state.planner_response = final_output
-                else:
-                    # Fallback for older CrewAI versions
-                    final_output = result.raw if hasattr(result, 'raw') else str(result)
-                    st.session_state.planner_response = final_output
-                    st.session_state.location_response = "Included in final plan"
-                    st.session_state.guide_response = "Included in final plan"
-                
-                st.write("🎉 Travel plan generation complete!")
-                
-        except Exception as e:
-            st.error(f"❌ Error during execution: {str(e)}")
-            st.session_state.execution_log.append(f"ERROR: {str(e)}")
-            
-            # Show debug information
-            with st.expander("🔍 Debug Information"):
-                st.code(str(e))
-                st.write("**Execution Log:**")
-                for log in st.session_state.execution_log:
-                    st.text(log)
-        
-        # Display Results Hierarchically
-        if st.session_state.planner_response:
-            st.markdown("---")
-            st.subheader("📊 Travel Plan Results")
-            
-            # Create tabs for better organization
-            tab1, tab2, tab3, tab4 = st.tabs(["📝 Full Itinerary", "📍 Location Info", "🎯 Local Guide", "📥 Downloads"])
-            
-            with tab1:
-                st.markdown('<div class="agent-section planner-section">', unsafe_allow_html=True)
-                st.markdown("### ✈️ Travel Planner Expert Report")
-                st.markdown(st.session_state.planner_response)
-                st.markdown('</div>', unsafe_allow_html=True)
-            
-            with tab2:
-                st.markdown('<div class="agent-section location-section">', unsafe_allow_html=True)
-                st.markdown("### 🏢 Location Expert Report")
-                if st.session_state.location_response:
-                    st.markdown(st.session_state.location_response)
-                else:
-                    st.info("Location information is included in the final itinerary below.")
-                st.markdown('</div>', unsafe_allow_html=True)
-            
-            with tab3:
-                st.markdown('<div class="agent-section guide-section">', unsafe_allow_html=True)
-                st.markdown("### 🎭 Local Guide Expert Report")
-                if st.session_state.guide_response:
-                    st.markdown(st.session_state.guide_response)
-                else:
-                    st.info("Guide information is included in the final itinerary below.")
-                st.markdown('</div>', unsafe_allow_html=True)
-            
-            with tab4:
-                st.markdown("### 📥 Download Your Travel Plan")
-                
-                # Prepare combined report
-                combined_report = f"""
-# 🌍 AI-POWERED TRIP PLAN TO {destination_city.upper()}
-
-**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-**Trip Duration:** {date_from} to {date_to}
-
----
-
-## 📍 LOCATION INFORMATION
-{st.session_state.location_response or 'See full itinerary below'}
-
----
-
-## 🎯 LOCAL GUIDE RECOMMENDATIONS
-{st.session_state.guide_response or 'See full itinerary below'}
-
----
-
-## ✈️ COMPLETE TRAVEL ITINERARY
-{st.session_state.planner_response}
-
----
-
-**Interests:** {interests}
-**Traveling from:** {from_city}
-**Destination:** {destination_city}
-"""
-                
-                # Download buttons
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.download_button(
-                        label="📄 Download as Text",
-                        data=combined_report,
-                        file_name=f"Travel_Plan_{destination_city}_{datetime.now().strftime('%Y%m%d')}.txt",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
-                
-                with col2:
-                    st.download_button(
-                        label="📋 Download as Markdown",
-                        data=combined_report,
-                        file_name=f"Travel_Plan_{destination_city}_{datetime.now().strftime('%Y%m%d')}.md",
-                        mime="text/markdown",
-                        use_container_width=True
-                    )
-                
-                with col3:
-                    # Prepare CSV summary
-                    csv_data = f"""Attribute,Value
-From City,{from_city}
-Destination,{destination_city}
-Departure Date,{date_from}
-Return Date,{date_to}
-Interests,{interests}
-Generated,{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-"""
-                    st.download_button(
-                        label="📊 Download Summary CSV",
-                        data=csv_data,
-                        file_name=f"Travel_Summary_{destination_city}_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
-                
-                # Success message
-                st.success("✅ All downloads are ready! Choose your preferred format above.")
-        
-        # Clear status after completion
-        status_placeholder.empty()
\ No newline at end of file
+            job = jobs.submit(partial(plan_job, previous=previous), inputs)
+            st.session_state.job_id = job.id
+            st.query_params["job"] = job.id
+        except JobLimitError as e:
+            st.error(f"❌ {str(e)}")
+
+# Show the current job, whether it is still running or finished
+if st.session_state.job_id:
+    current_job = jobs.get(st.session_state.job_id)
+    if current_job is None:
+        st.warning("⌛ That travel plan is no longer available. Please generate it again.")
+        st.session_state.job_id = None
+        del st.query_params["job"]
+    elif current_job.done:
+        render_job(current_job)
+    else:
+        poll_job(current_job.id)
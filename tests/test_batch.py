@@ -0,0 +1,36 @@
+import json
+import sys
+
+from TravelBatch import plan_trip, run_batch
+
+TRIP = {"id": "rome", "from_city": "London", "destination_city": "Rome", "date_from": "2030-06-01",
+        "date_to": "2030-06-03", "interests": "food"}
+
+
+def test_invalid_json_lines_keep_their_reason():
+    record = plan_trip({"id": "line-2", "error": "invalid JSON object"}, "parallel")
+    assert record["status"] == "error"
+    assert record["error"] == "ValueError: invalid JSON object"
+
+
+def test_import_failure_in_a_worker_is_recorded_per_trip(monkeypatch):
+    # A None entry makes "from TravelCrew import ..." raise ImportError
+    monkeypatch.setitem(sys.modules, "TravelCrew", None)
+    record = plan_trip(TRIP, "parallel")
+    assert record["status"] == "error"
+    assert "TravelCrew" in record["error"]
+
+
+def test_batch_writes_one_record_per_line_when_planning_fails(tmp_path):
+    input_path = tmp_path / "trips.jsonl"
+    # Neither line gets as far as importing the pipeline, so nothing is planned for real
+    incomplete = {key: value for key, value in TRIP.items() if key != "interests"}
+    input_path.write_text(json.dumps(incomplete) + "\nnot json\n", encoding="utf-8")
+    output_path = tmp_path / "plans.jsonl"
+
+    stats = run_batch(str(input_path), str(output_path), workers=1, rate=0, log=lambda message: None)
+
+    records = {record["id"]: record for record in map(json.loads, output_path.read_text(encoding="utf-8").splitlines())}
+    assert stats["error"] == len(records) == 2
+    assert records["rome"]["error"] == "ValueError: Missing trip fields: interests"
+    assert records["line-2"]["error"] == "ValueError: invalid JSON object"
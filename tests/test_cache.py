@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+import TravelCache
+from TravelCache import DAY, SearchCache, TTLCache
+
+
+class Clock:
+    """
+    Stand-in for time.time that only moves when told to
+    """
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(TravelCache.time, "time", clock)
+    return clock
+
+
+class FakeSearch:
+    """
+    Stand-in for TravelTools.live_search that counts its calls
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, query, max_results=10):
+        with self._lock:
+            self.calls.append(query)
+        time.sleep(self.delay)
+        return [{"title": query, "href": "https://example.com", "body": f"results for {query}"}]
+
+
+def test_each_topic_expires_after_its_own_ttl(tmp_path, clock):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"), topic_ttls={"visa": DAY, "attractions": 30 * DAY})
+    search = FakeSearch()
+    cache.get_or_search("Italy visa requirements", search)
+    cache.get_or_search("Rome attractions", search)
+
+    clock.advance(2 * DAY)
+    cache.get_or_search("Italy visa requirements", search)
+    cache.get_or_search("Rome attractions", search)
+
+    assert search.calls == ["Italy visa requirements", "Rome attractions", "Italy visa requirements"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_equivalent_queries_share_a_key_but_routes_keep_their_direction(tmp_path, clock):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"))
+    search = FakeSearch()
+    cache.get_or_search("Flights from New Delhi to Rome", search)
+    cache.get_or_search("flights from new delhi to the Rome", search)
+    cache.get_or_search("flights from Rome to New Delhi", search)
+
+    assert search.calls == ["Flights from New Delhi to Rome", "flights from Rome to New Delhi"]
+
+
+def test_evicts_least_recently_used_past_max_entries(tmp_path, clock):
+    cache = TTLCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", 1, DAY)
+    clock.advance(1)
+    cache.set("b", 2, DAY)
+    clock.advance(1)
+    assert cache.get("a") == 1
+    clock.advance(1)
+    cache.set("c", 3, DAY)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_evicts_least_recently_used_past_max_bytes(tmp_path, clock):
+    value = "x" * 100
+    cache = TTLCache(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    for key in ("a", "b"):
+        cache.set(key, value, DAY)
+        clock.advance(1)
+    cache.get("a")
+    clock.advance(1)
+    cache.set("c", value, DAY)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+
+
+def test_expired_entries_are_evicted_first(tmp_path, clock):
+    cache = TTLCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("short", 1, 10)
+    clock.advance(1)
+    cache.set("long", 2, DAY)
+    clock.advance(20)
+    cache.set("new", 3, DAY)
+
+    assert (cache.get("short"), cache.get("long"), cache.get("new")) == (None, 2, 3)
+
+
+def _search_concurrently(search_fn, threads=8):
+    results = [None] * threads
+    start = threading.Barrier(threads)
+
+    def worker(index):
+        start.wait()
+        results[index] = search_fn()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+
+def test_concurrent_identical_searches_make_one_live_search(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"))
+    search = FakeSearch(delay=0.2)
+
+    results = _search_concurrently(lambda: cache.get_or_search("Rome weather in June", search))
+
+    assert len(search.calls) == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_search_tool_coalesces_through_live_search(tmp_path, monkeypatch):
+    TravelTools = pytest.importorskip("TravelTools")
+    search = FakeSearch(delay=0.2)
+    monkeypatch.setattr(TravelTools, "live_search", search)
+    monkeypatch.setattr(TravelTools, "search_cache", SearchCache(path=str(tmp_path / "search.sqlite3")))
+
+    results = _search_concurrently(lambda: TravelTools._search("Rome metro ticket prices"))
+
+    assert len(search.calls) == 1
+    assert all(result == results[0] for result in results)
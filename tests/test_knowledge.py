@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+
+from TravelCache import KnowledgeStore
+from TravelKnowledge import prefetch, stage_knowledge
+
+
+@pytest.fixture
+def store(tmp_path):
+    return KnowledgeStore(path=str(tmp_path / "knowledge.sqlite3"))
+
+
+def test_prefetch_stores_the_search_text_and_force_searches_again(store):
+    pytest.importorskip("TravelTools")
+    searched = []
+
+    def search(query):
+        searched.append(query)
+        return f"[1] {query} (example.com)\nsnippet"
+
+    stats = prefetch(["Rome"], ["London"], months=1, store=store, search=search, today=date(2030, 6, 1),
+                     log=lambda message: None)
+    assert stats["fetched"] == len(searched) > 0
+
+    again = prefetch(["Rome"], ["London"], months=1, store=store, search=search, today=date(2030, 6, 1),
+                     log=lambda message: None)
+    assert again["fetched"] == 0 and again["fresh"] == stats["fetched"]
+
+    forced = prefetch(["Rome"], ["London"], months=1, store=store, search=search, force=True,
+                      today=date(2030, 6, 1), log=lambda message: None)
+    assert forced["fetched"] == stats["fetched"]
+    assert len(searched) == 2 * stats["fetched"]
+
+    inputs = {"from_city": "London", "destination_city": "Rome", "date_from": date(2030, 6, 10),
+              "date_to": date(2030, 6, 12)}
+    knowledge = stage_knowledge("location", inputs, store)
+    assert knowledge.complete
+    assert knowledge.found["Weather"]["text"] == "[1] Rome weather in June 2030 (example.com)\nsnippet"
@@ -0,0 +1,274 @@
+import email.utils
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+
+import pytest
+
+import TravelLimits
+from TravelLimits import TokenBucket, call_with_retry, is_retryable, retry_after
+
+
+class StatusError(Exception):
+    """
+    Error carrying an HTTP status and headers, like provider SDK errors
+    """
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(TravelLimits.time, "sleep", delays.append)
+    return delays
+
+
+def test_token_bucket_allows_a_burst_then_paces_calls():
+    bucket = TokenBucket(rate=20, capacity=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    burst = time.monotonic() - started
+    for _ in range(4):
+        bucket.acquire()
+    paced = time.monotonic() - started
+
+    assert burst < 0.05
+    # 4 calls past the burst need 4 new tokens at 20 per second
+    assert 0.18 <= paced < 0.5
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_retry_after_reads_seconds():
+    assert retry_after(StatusError(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(StatusError(429, {"retry-after": "0.5"})) == 0.5
+
+
+def test_retry_after_reads_an_http_date():
+    when = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= retry_after(StatusError(503, {"Retry-After": when})) <= 10
+
+
+def test_retry_after_ignores_missing_or_invalid_values():
+    assert retry_after(StatusError(429)) is None
+    assert retry_after(StatusError(429, {"Retry-After": "soon"})) is None
+    assert retry_after(ValueError("no headers")) is None
+
+
+def test_retries_rate_limits_with_the_requested_delay(sleeps):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise StatusError(429, {"Retry-After": "2"})
+        return "ok"
+
+    assert call_with_retry("test", flaky) == "ok"
+    assert len(calls) == 3
+    assert sleeps == [2.0, 2.0]
+
+
+def test_does_not_retry_non_retryable_errors(sleeps):
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        call_with_retry("test", bad_request)
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_the_last_attempt(sleeps):
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        raise StatusError(503)
+
+    with pytest.raises(StatusError):
+        call_with_retry("test", unavailable)
+    assert len(calls) == TravelLimits.RETRY_ATTEMPTS
+    assert len(sleeps) == TravelLimits.RETRY_ATTEMPTS - 1
+    assert all(0 <= delay <= TravelLimits.RETRY_MAX_DELAY for delay in sleeps)
+
+
+def test_classifies_errors_by_status_or_name():
+    class RateLimitError(Exception):
+        pass
+
+    assert is_retryable(StatusError(429))
+    assert is_retryable(RateLimitError())
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(StatusError(404))
+    assert not is_retryable(ValueError())
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Local HTTP server that answers the first request with 429 and a
+    Retry-After of one second, and later requests with 200
+    """
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(time.monotonic())
+            if len(requests) == 1:
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.end_headers()
+                return
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/", requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_waits_for_retry_after_from_a_mock_server(mock_server):
+    url, requests = mock_server
+
+    def fetch():
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.read()
+
+    assert call_with_retry("test", fetch) == b'{"ok": true}'
+    assert len(requests) == 2
+    assert requests[1] - requests[0] >= 0.9
+
+
+def test_pooled_client_retries_a_mock_server(mock_server):
+    pytest.importorskip("httpx")
+    url, requests = mock_server
+    client = TravelLimits.http_client()
+
+    def fetch():
+        response = client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    assert call_with_retry("test", fetch) == {"ok": True}
+    assert len(requests) == 2
+    assert requests[1] - requests[0] >= 0.9
+
+
+def test_live_search_retries_a_throttled_search(monkeypatch, sleeps):
+    TravelTools = pytest.importorskip("TravelTools")
+    calls = []
+
+    class ThrottledDDGS:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def text(self, query, max_results=10):
+            calls.append(query)
+            if len(calls) == 1:
+                raise StatusError(429, {"Retry-After": "1"})
+            return [{"title": query, "href": "https://example.com", "body": "ok"}]
+
+    monkeypatch.setattr(TravelTools, "DDGS", ThrottledDDGS)
+    monkeypatch.setattr(TravelTools, "_ddgs_local", threading.local())
+
+    assert TravelTools.live_search("Rome weather")[0]["body"] == "ok"
+    assert len(calls) == 2
+    assert sleeps == [1.0]
+
+
+def test_batches_reuse_the_search_threads_and_clients(monkeypatch):
+    TravelTools = pytest.importorskip("TravelTools")
+    clients = []
+
+    class CountingDDGS:
+        def __init__(self, *args, **kwargs):
+            clients.append(self)
+
+        def text(self, query, max_results=10):
+            time.sleep(0.01)
+            return [{"title": query, "href": "https://example.com", "body": "ok"}]
+
+    monkeypatch.setattr(TravelTools, "DDGS", CountingDDGS)
+    monkeypatch.setattr(TravelTools, "_ddgs_local", threading.local())
+
+    for batch in range(3):
+        response = TravelTools.search_many([f"query {batch}-{i}" for i in range(6)], search=TravelTools.live_search)
+        assert all("results" in entry for entry in response.values())
+    assert len(clients) <= TravelTools.SEARCH_BATCH_WORKERS
+
+
+def test_timeouts_start_when_a_query_runs_not_when_it_is_queued(monkeypatch):
+    TravelTools = pytest.importorskip("TravelTools")
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(TravelTools, "_search_pool", pool)
+
+    def slow_search(query):
+        time.sleep(0.5)
+        return query
+
+    responses = {}
+
+    def batch(name, count):
+        queries = [f"{name} {i}" for i in range(count)]
+        responses[name] = TravelTools.search_many(queries, timeout=0.6, search=slow_search)
+
+    # The second batch queues behind both waves of the first one on the shared pool
+    first = threading.Thread(target=batch, args=("first", 8))
+    first.start()
+    time.sleep(0.05)
+    batch("second", 4)
+    first.join()
+    pool.shutdown()
+
+    for name, count in (("first", 8), ("second", 4)):
+        assert len(responses[name]) == count
+        assert all("results" in entry for entry in responses[name].values()), responses[name]
+
+
+def test_queries_over_the_batch_limit_are_reported_not_dropped(monkeypatch):
+    TravelTools = pytest.importorskip("TravelTools")
+    monkeypatch.setattr(TravelTools, "search_compact", lambda query: f"results for {query}")
+    queries = [f"topic {i}" for i in range(TravelTools.SEARCH_BATCH_MAX_QUERIES + 2)]
+
+    response = json.loads(TravelTools.search_web_batch_tool.func(queries))
+
+    assert list(response) == queries
+    for query in queries[:TravelTools.SEARCH_BATCH_MAX_QUERIES]:
+        assert response[query] == {"results": f"results for {query}"}
+    for query in queries[TravelTools.SEARCH_BATCH_MAX_QUERIES:]:
+        assert response[query] == {"error": f"not run: batch limit is {TravelTools.SEARCH_BATCH_MAX_QUERIES} queries"}
+
+
+def test_urllib_errors_are_classified_by_status():
+    error = HTTPError("http://example.com", 429, "Too Many Requests", {"Retry-After": "4"}, None)
+    assert is_retryable(error)
+    assert retry_after(error) == 4.0
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+import TravelLimits
+from TravelRouting import ModelRouter, ModelTier
+
+TIERS = {
+    "fast": ModelTier("fast", "stub/fast", 0.1, 0.1, latency_budget=1.0),
+    "large": ModelTier("large", "stub/large", 0.4, 2.0, latency_budget=0.1, fallback="fast"),
+}
+
+
+def test_a_call_over_budget_sends_later_calls_to_the_fallback():
+    router = ModelRouter(TIERS, {"planner": "large"}, cooldown=60)
+    assert router.choose("planner") == (TIERS["large"], None)
+    assert not router.record(TIERS["large"], 0.05)
+    assert router.choose("planner") == (TIERS["large"], None)
+
+    assert router.record(TIERS["large"], 0.5)
+    assert router.choose("planner") == (TIERS["fast"], "large")
+
+
+def test_the_fallback_ends_after_the_cooldown():
+    router = ModelRouter(TIERS, {"planner": "large"}, cooldown=0.05)
+    router.record(TIERS["large"], 0.5)
+    time.sleep(0.1)
+    assert router.choose("planner") == (TIERS["large"], None)
+
+
+def test_unknown_tiers_in_routes_are_rejected():
+    with pytest.raises(ValueError):
+        ModelRouter(TIERS, {"planner": "huge"})
+
+
+@pytest.fixture
+def routed_llm():
+    """
+    Build a routed planner LLM on stub backends that answer after latency[model] seconds
+    """
+    TravelAgents = pytest.importorskip("TravelAgents")
+    latency = {}
+
+    class StubLLM(TravelAgents.TravelLLM):
+        def complete(self, messages, *args, **kwargs):
+            time.sleep(latency.get(self.model, 0.0))
+            return f"answer from {self.model}"
+
+    def make_llm(model):
+        return StubLLM(model=model, temperature=0.2)
+
+    def build():
+        router = ModelRouter(TIERS, {"planner": "large"}, cooldown=60)
+        return TravelAgents.RoutedLLM("planner", router, make_llm), router
+
+    return build, latency
+
+
+def test_waiting_for_a_rate_limit_slot_does_not_count_against_the_budget(routed_llm, monkeypatch):
+    build, _ = routed_llm
+    # The provider answers at once, but every call first waits on the rate limiter
+    monkeypatch.setattr(TravelLimits, "throttle", lambda backend: time.sleep(0.3))
+    llm, router = build()
+
+    assert llm.call("plan the trip") == "answer from stub/large"
+    assert router.choose("planner") == (TIERS["large"], None)
+
+
+def test_a_slow_provider_sends_the_next_call_to_the_fallback(routed_llm):
+    build, latency = routed_llm
+    latency["stub/large"] = 0.3
+    llm, router = build()
+
+    # The slow call still completes on its own tier
+    assert llm.call("plan the trip") == "answer from stub/large"
+    assert llm.call("plan the trip") == "answer from stub/fast"
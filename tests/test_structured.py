@@ -0,0 +1,63 @@
+import time
+from datetime import date
+
+import pytest
+
+from TravelModels import DayPlan, DayPlans, TravelPlan, parse_model
+
+PLAN = TravelPlan(currency="EUR", summary="Three days of Roman food", days=[
+    DayPlan(day=1, date="2030-06-01", title="Ancient Rome"),
+    DayPlan(day=2, date="2030-06-02", title="Trastevere"),
+])
+
+
+def test_parse_model_reads_json_inside_prose_and_code_fences():
+    text = f"Here is the plan:\n```json\n{PLAN.model_dump_json()}\n```\nEnjoy!"
+    assert parse_model(TravelPlan, text) == PLAN
+
+
+def test_parse_model_returns_none_for_non_json_and_cut_off_answers():
+    assert parse_model(TravelPlan, "## Day 1 - 2030-06-01\n- 09:00 Colosseum") is None
+    assert parse_model(TravelPlan, PLAN.model_dump_json()[:-40]) is None
+    assert parse_model(DayPlans, '{"currency": "EUR", "days": [{"day": "first"}]}') is None
+    assert parse_model(TravelPlan, None) is None
+
+
+@pytest.fixture
+def run_planner(tmp_path, monkeypatch):
+    """
+    Run a structured planner task on an LLM that always gives the same final answer
+    """
+    pytest.importorskip("crewai")
+    # Importing the pipeline opens its caches in the working directory
+    monkeypatch.chdir(tmp_path)
+    TravelCrew = pytest.importorskip("TravelCrew")
+    from TravelAgents import TravelLLM, create_planner_expert
+    from TravelTasks import planner_task
+
+    class AnswerLLM(TravelLLM):
+        answer = ""
+
+        def complete(self, messages, *args, **kwargs):
+            return "Thought: I now know the final answer\nFinal Answer: " + self.answer
+
+    def run(answer):
+        llm = AnswerLLM(model="mistral/mistral-small-latest", temperature=0.2)
+        llm.answer = answer
+        agent = create_planner_expert(llm)
+        task = planner_task([], agent, "Rome", "food", date(2030, 6, 1), date(2030, 6, 2),
+                            research_digest="Colosseum, Trastevere", structured=True)
+        output, _ = TravelCrew._run_stage("planner", agent, task, time.perf_counter())
+        return output
+
+    return run
+
+
+def test_planner_keeps_the_raw_answer_when_it_is_not_json(run_planner):
+    output = run_planner("## Day 1 - 2030-06-01\n- 09:00 Colosseum")
+    assert isinstance(output, str)
+    assert "Colosseum" in output
+
+
+def test_planner_reads_a_json_answer_as_a_travel_plan(run_planner):
+    assert run_planner(PLAN.model_dump_json()) == PLAN